@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,15 +44,64 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "chatbot.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "chatbot.middleware.AdmissionControlMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Request metrics (chatbot.middleware.RequestMetricsMiddleware): share of the
+# requests that are recorded, number of repetitions of one SQL shape in a
+# request reported as a possible N+1, and clients allowed to scrape
+# /chatbot-api/metrics/.
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 1.0 if DEBUG else 0.05))
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = int(os.environ.get('REQUEST_METRICS_N_PLUS_ONE_THRESHOLD', 10))
+REQUEST_METRICS_ALLOWED_IPS = os.environ.get('REQUEST_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Bot answer cache (chatbot.answer_cache): maximum number of cached answers per
+# process, and minimum similarity (Jaccard over character 3-grams) for a
+# question to reuse the answer of another one.
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 10000))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', 0.8))
+
+# Admission control (chatbot.middleware.AdmissionControlMiddleware).
+# Endpoints and the URL prefixes they cover:
+ADMISSION_ENDPOINTS = {
+    'chat': ['/chatbot-api/chat-messages/', '/chatbot-api/chat-sessions/'],
+    'catalog': ['/chatbot-api/products/'],
+    'orders': ['/chatbot-api/orders/'],
+}
+# Token bucket of every user (or anonymous client IP) per endpoint and tier:
+# (tokens refilled per second, burst size).
+RATE_LIMITS = {
+    'chat': {'free': (1, 10), 'premium': (5, 30)},
+    'catalog': {'free': (10, 40), 'premium': (30, 100)},
+    'orders': {'free': (2, 10), 'premium': (10, 30)},
+}
+# Endpoint-wide token buckets shared by all the free-tier users.
+ENDPOINT_RATE_LIMITS = {
+    'chat': (100, 200),
+    'catalog': (500, 1000),
+    'orders': (100, 200),
+}
+# Concurrent requests per worker process; the others wait (premium first) up
+# to ADMISSION_QUEUE_TIMEOUT seconds in a queue of at most ADMISSION_MAX_QUEUE.
+ADMISSION_CONCURRENCY = {
+    'chat': int(os.environ.get('ADMISSION_CHAT_CONCURRENCY', 8)),
+}
+ADMISSION_QUEUE_TIMEOUT = 2.0
+ADMISSION_MAX_QUEUE = 64
+# Seconds a customer's tier (UserProfile.is_premium_user) is cached per process.
+ADMISSION_TIER_TTL = 60.0
+# SQLite file holding the token buckets, shared by the workers of a host
+# (empty: buckets are kept in the memory of each process).
+RATE_LIMIT_STORE_PATH = os.environ.get('RATE_LIMIT_STORE_PATH', str(BASE_DIR / 'ratelimit.sqlite3'))
+
 ROOT_URLCONF = "ai_powered_e_commerce_chatbot.urls"
 
 TEMPLATES = [
@@ -75,17 +126,73 @@ WSGI_APPLICATION = "ai_powered_e_commerce_chatbot.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.postgresql",
-        "NAME": "chatbot_db",
-        'USER':'user01',
-        'PASSWORD':'user01',
-        'HOST':'localhost',
-        'PORT':5432,
+# Connection handling. Every request used to open a fresh connection, which
+# dominated latency under load. Connections are now either kept open between
+# requests (CONN_MAX_AGE, with a health check before reuse) or, when psycopg 3
+# and psycopg_pool are installed, served from Django's native connection pool.
+# Django's pool requires CONN_MAX_AGE = 0, so the two modes are exclusive.
+# https://docs.djangoproject.com/en/5.1/ref/databases/#persistent-connections
+# https://docs.djangoproject.com/en/5.1/ref/databases/#connection-pool
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'django.db.backends.postgresql')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+DB_POOL_ENABLED = (
+    os.environ.get('DB_POOL', '1') == '1'
+    and DB_ENGINE == 'django.db.backends.postgresql'
+    and find_spec('psycopg') is not None
+    and find_spec('psycopg_pool') is not None
+)
+
+# Each worker process gets its own pool, so the server-side connection budget
+# (max_connections minus some headroom) is divided between the workers.
+WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 80))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', max(2, DB_MAX_CONNECTIONS // WEB_CONCURRENCY)))
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', min(2, DB_POOL_MAX_SIZE)))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+
+
+def _database(host):
+    if DB_ENGINE == 'django.db.backends.sqlite3':
+        return {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        }
+    database = {
+        'ENGINE': DB_ENGINE,
+        'NAME': os.environ.get('DB_NAME', 'chatbot_db'),
+        'USER': os.environ.get('DB_USER', 'user01'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'user01'),
+        'HOST': host,
+        'PORT': int(os.environ.get('DB_PORT', 5432)),
+        'CONN_MAX_AGE': 0 if DB_POOL_ENABLED else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
     }
+    if DB_POOL_ENABLED:
+        database['OPTIONS']['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+        }
+    return database
+
+
+DATABASES = {
+    "default": _database(os.environ.get('DB_HOST', 'localhost')),
 }
 
+# Optional read replica: the read-only viewset actions are routed to it by
+# chatbot.db_routers.ReadReplicaRouter; everything else stays on "default".
+DB_REPLICA_HOST = os.environ.get('DB_REPLICA_HOST')
+if DB_REPLICA_HOST:
+    DATABASES['replica'] = _database(DB_REPLICA_HOST)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['chatbot.db_routers.ReadReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -123,6 +230,19 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Uploaded files (product images, profile pictures)
+
+MEDIA_URL = "media/"
+MEDIA_ROOT = BASE_DIR / "media"
+
+# Resized WebP variants generated for every uploaded image (name: max width, max height),
+# and the number of processes rendering them (see chatbot.images)
+IMAGE_VARIANTS = {
+    'thumbnail': (150, 150),
+    'medium': (600, 600),
+}
+IMAGE_PIPELINE_WORKERS = int(os.environ.get('IMAGE_PIPELINE_WORKERS', 2))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
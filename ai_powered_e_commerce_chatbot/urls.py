@@ -15,6 +15,8 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
@@ -23,4 +25,6 @@ urlpatterns = [
     #add a path for the chatbot API
     path('chatbot-api/', include('chatbot.urls')),
 ]
+#serve the uploaded images (and their variants) in development
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     
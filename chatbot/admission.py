@@ -0,0 +1,150 @@
+"""
+Admission control: token-bucket rate limits per user and per endpoint, and a
+priority queue in front of the endpoints with a concurrency limit, which
+serves premium users first when every slot is busy.
+"""
+import heapq
+import itertools
+import math
+import sqlite3
+import threading
+import time
+
+
+class MemoryTokenBucketStore:
+    """Token buckets of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, capacity, now=None):
+        """
+        Take a token from the bucket key, refilled at rate tokens per second up
+        to capacity. Returns (allowed, seconds until a token is available).
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, allowed, retry_after = _take(tokens, updated, rate, capacity, now)
+            self._buckets[key] = (tokens, now)
+        return allowed, retry_after
+
+
+class SQLiteTokenBucketStore:
+    """
+    Token buckets kept in a local SQLite file, so every worker process of the
+    host shares them. Each take is one short IMMEDIATE transaction; the file
+    is not synced to disk since losing rate limit state is harmless.
+    """
+
+    PURGE_EVERY = 1000
+    PURGE_AFTER = 3600
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        self._takes = itertools.count()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS token_buckets '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, rate, capacity, now=None):
+        now = time.time() if now is None else now
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM token_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row is not None else (capacity, now)
+            tokens, allowed, retry_after = _take(tokens, updated, rate, capacity, now)
+            connection.execute(
+                'INSERT INTO token_buckets (key, tokens, updated) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (key, tokens, now),
+            )
+            if next(self._takes) % self.PURGE_EVERY == 0:
+                # Buckets idle that long are full again: dropping them changes nothing.
+                connection.execute('DELETE FROM token_buckets WHERE updated < ?', (now - self.PURGE_AFTER,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+
+def _take(tokens, updated, rate, capacity, now):
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, True, 0.0
+    return tokens, False, (1 - tokens) / rate if rate > 0 else math.inf
+
+
+class PriorityLimiter:
+    """
+    Concurrency limit with a priority queue: when all slots are busy, callers
+    wait in (priority, arrival) order, lower priorities first. A caller that
+    finds max_queue callers waiting, or waits longer than its timeout, is
+    refused so the client can be told to come back later.
+    """
+
+    def __init__(self, slots, max_queue=64):
+        self.slots = slots
+        self.max_queue = max_queue
+        self.active = 0
+        self._lock = threading.Lock()
+        self._waiting = []
+        self._arrivals = itertools.count()
+
+    def acquire(self, priority, timeout):
+        with self._lock:
+            if self.active < self.slots and not self._waiting:
+                self.active += 1
+                return True
+            if len(self._waiting) >= self.max_queue:
+                # A full queue makes room for a higher priority caller by
+                # refusing its last lower priority waiter.
+                last = max(self._waiting)
+                if last[0] <= priority:
+                    return False
+                self._waiting.remove(last)
+                heapq.heapify(self._waiting)
+                last[3] = 'refused'
+                last[2].set()
+            # [priority, arrival, event, state]: state is None while waiting,
+            # 'granted' once a slot is handed over to it, 'refused' when it is
+            # pushed out of a full queue.
+            waiter = [priority, next(self._arrivals), threading.Event(), None]
+            heapq.heappush(self._waiting, waiter)
+        waiter[2].wait(timeout)
+        with self._lock:
+            if waiter[3] == 'granted':
+                return True
+            if waiter[3] is None:
+                # Timed out: leave the queue.
+                self._waiting.remove(waiter)
+                heapq.heapify(self._waiting)
+            return False
+
+    def release(self):
+        with self._lock:
+            # Hand the slot over to the first waiter, if any.
+            if self._waiting:
+                waiter = heapq.heappop(self._waiting)
+                waiter[3] = 'granted'
+                waiter[2].set()
+                return
+            self.active -= 1
+
+    @property
+    def queued(self):
+        return len(self._waiting)
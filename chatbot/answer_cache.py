@@ -0,0 +1,227 @@
+"""
+Cache of the bot replies to user questions.
+
+Questions are looked up by their normalized text first, then by similarity:
+character 3-gram MinHash signatures are indexed with LSH bands and the
+candidates are verified by Jaccard similarity. A cached reply is only
+returned when the question mentions the same entities (chatbot.nlp) and
+the data it depends on has not changed since: every entry records the
+versions of what it depends on and is dropped once one of them moves on.
+
+- a question naming products or categories depends on those products and
+  categories only;
+- any other catalog question depends on the whole catalog (ALL_PRODUCTS);
+- an order status question depends on the orders of the user asking.
+
+Versions are DataVersion rows, bumped in the transaction writing the data,
+so every worker and host sees the same ones.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import router
+from django.db.models import F
+
+from . import nlp
+from .metrics import registry
+from .models import DataVersion
+
+NUM_PERMUTATIONS = 32
+BAND_SIZE = 4
+_PRIME = (1 << 61) - 1
+# Fixed (a, b) pairs of the universal hash functions h(x) = (a * x + b) mod p.
+_PERMUTATIONS = [
+    (1 + (index * 0x9E3779B97F4A7C15) % (_PRIME - 1), (index * 0xC2B2AE3D27D4EB4F) % _PRIME)
+    for index in range(1, NUM_PERMUTATIONS + 1)
+]
+
+# Words dropped before comparing questions: they do not change what is asked.
+STOPWORDS = frozenset({'a', 'an', 'the', 'please', 'pls', 'hi', 'hello', 'hey', 'thanks'})
+
+ALL_PRODUCTS = 'products'
+
+registry.describe_counter('chatbot_answer_cache_lookups_total', 'Answer cache lookups by result (hit, miss, stale).')
+
+
+def product_key(product_id):
+    return f'product:{product_id}'
+
+
+def category_key(category):
+    # Categories are matched in normalized form (see chatbot.nlp)
+    return f'category:{nlp.normalize(category)}'
+
+
+def user_orders_key(user_id):
+    return f'orders:user:{user_id}'
+
+
+def data_versions(keys):
+    """{key: version} of the given keys (0 for keys never bumped)."""
+    # Read from the primary: a lagging replica would return versions that have already moved on
+    rows = DataVersion.objects.using(router.db_for_write(DataVersion)).filter(key__in=keys)
+    versions = dict.fromkeys(keys, 0)
+    versions.update(rows.values_list('key', 'version'))
+    return versions
+
+
+def bump_data_version(*keys):
+    """Invalidate every cached answer depending on one of the keys."""
+    keys = set(keys)
+    using = router.db_for_write(DataVersion)
+    DataVersion.objects.using(using).bulk_create([DataVersion(key=key) for key in keys], ignore_conflicts=True)
+    DataVersion.objects.using(using).filter(key__in=keys).update(version=F('version') + 1)
+
+
+def shingles(text, size=3):
+    padded = f' {text} '
+    return {padded[index:index + size] for index in range(max(1, len(padded) - size + 1))}
+
+
+def minhash(grams):
+    hashes = [zlib.crc32(gram.encode()) for gram in grams]
+    return [min((a * value + b) % _PRIME for value in hashes) for a, b in _PERMUTATIONS]
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+class CacheEntry:
+    __slots__ = ('key', 'grams', 'bands', 'answer', 'versions')
+
+    def __init__(self, key, grams, bands, answer, versions):
+        self.key = key
+        self.grams = grams
+        self.bands = bands
+        self.answer = answer
+        self.versions = versions
+
+
+class AnswerCache:
+    """In-memory, size-bounded (LRU) answer cache of one process."""
+
+    def __init__(self, max_entries=10000, similarity=0.8):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _context(text, user_id):
+        """
+        Normalized text, the scope a cached answer can be shared in (the
+        intent, the exact entities and, for order status, the user) and the
+        version keys of the data the answer depends on.
+        """
+        analysis = nlp.get_analyzer().analyze(text)
+        entities = analysis['entities']
+        intent = analysis['intent']
+        scope = (
+            intent,
+            tuple(entities['product_ids']), tuple(entities['categories']), tuple(entities['order_ids']),
+            entities['price_min'], entities['price_max'],
+            user_id if intent == nlp.ORDER_STATUS else None,
+        )
+        if intent == nlp.ORDER_STATUS:
+            keys = (user_orders_key(user_id),)
+        else:
+            keys = tuple(product_key(product_id) for product_id in entities['product_ids'])
+            keys += tuple(category_key(category) for category in entities['categories'])
+        normalized = ' '.join(word for word in nlp.normalize(text).split() if word not in STOPWORDS)
+        return normalized, scope, keys or (ALL_PRODUCTS,)
+
+    def _bands(self, scope, signature):
+        return [
+            (scope, index, tuple(signature[index:index + BAND_SIZE]))
+            for index in range(0, NUM_PERMUTATIONS, BAND_SIZE)
+        ]
+
+    def get(self, text, user_id=None):
+        """The cached answer to a question close enough to text, or None."""
+        normalized, scope, keys = self._context(text, user_id)
+        versions = data_versions(keys)
+        grams = shingles(normalized)
+        with self._lock:
+            entry = self._entries.get((scope, normalized))
+            if entry is None:
+                best = 0.0
+                for band in self._bands(scope, minhash(grams)):
+                    for key in self._buckets.get(band, ()):
+                        candidate = self._entries[key]
+                        score = jaccard(grams, candidate.grams)
+                        if score >= self.similarity and score > best:
+                            entry, best = candidate, score
+            # Entries of one scope depend on the same keys
+            if entry is not None and entry.versions != versions:
+                self._remove(entry.key)
+                registry.increment('chatbot_answer_cache_lookups_total', (('result', 'stale'),))
+                entry = None
+            if entry is None:
+                self.misses += 1
+                registry.increment('chatbot_answer_cache_lookups_total', (('result', 'miss'),))
+                return None
+            self._entries.move_to_end(entry.key)
+            self.hits += 1
+            registry.increment('chatbot_answer_cache_lookups_total', (('result', 'hit'),))
+            return entry.answer
+
+    def put(self, text, answer, user_id=None):
+        normalized, scope, keys = self._context(text, user_id)
+        versions = data_versions(keys)
+        grams = shingles(normalized)
+        key = (scope, normalized)
+        bands = self._bands(scope, minhash(grams))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = CacheEntry(key, grams, bands, answer, versions)
+            for band in bands:
+                self._buckets.setdefault(band, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in entry.bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(
+                    max_entries=getattr(settings, 'ANSWER_CACHE_MAX_ENTRIES', 10000),
+                    similarity=getattr(settings, 'ANSWER_CACHE_SIMILARITY', 0.8),
+                )
+    return _answer_cache
@@ -0,0 +1,221 @@
+"""
+End-to-end API benchmark scenarios, run through the Django test client or
+the ASGI application (see the run_benchmarks management command).
+"""
+import asyncio
+import json
+import random
+import time
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.test import Client
+
+from .models import ChatSession, Order, Product, UserProfile
+
+API = '/chatbot-api'
+
+
+class QueryCounter:
+    """
+    Counts the queries of the current request. The execute wrapper is added
+    from the request_started signal so it lands on the connection of the
+    thread that serves the request (ASGI runs sync views in a worker thread).
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def started(self, **kwargs):
+        for connection in connections.all():
+            connection.execute_wrappers.append(self)
+
+    def finished(self, **kwargs):
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+    def __enter__(self):
+        request_started.connect(self.started)
+        request_finished.connect(self.finished)
+        return self
+
+    def __exit__(self, *exc_info):
+        request_started.disconnect(self.started)
+        request_finished.disconnect(self.finished)
+
+
+class Scenario:
+    """A named request generator: request(i) returns (method, path, json body or None)."""
+
+    def __init__(self, name, request):
+        self.name = name
+        self.request = request
+
+
+def build_scenarios(seed):
+    """Build the scenarios from the seeded dataset; the same seed gives the same request sequence."""
+    rng = random.Random(seed)
+    user_ids = list(UserProfile.objects.order_by('id').values_list('id', flat=True))
+    products = list(Product.objects.order_by('id').values_list('id', 'name', 'price'))
+    chat_ids = list(ChatSession.objects.order_by('id').values_list('id', flat=True))
+    if not (user_ids and products and chat_ids):
+        raise ValueError('The benchmark dataset needs users, products and chat sessions.')
+    search_terms = sorted({name.split()[0].lower() for _, name, _ in products})
+
+    def order_body(i):
+        chosen = rng.sample(products, k=min(len(products), rng.randint(1, 5)))
+        return {
+            'user': rng.choice(user_ids),
+            'items': [{'product': product_id, 'quantity': rng.randint(1, 3)} for product_id, _, _ in chosen],
+            'status': Order.OrderStatus.PENDING,
+        }
+
+    def chat_body(i):
+        return {
+            'chat_session': rng.choice(chat_ids),
+            'message_type': 'USER',
+            'content': f'Is {rng.choice(products)[1]} in stock? ({i})',
+        }
+
+    return [
+        Scenario('product_list', lambda i: ('GET', f'{API}/products/', None)),
+        Scenario('product_search', lambda i: ('GET', f'{API}/products/by_name/{rng.choice(search_terms)}/', None)),
+        Scenario('order_list', lambda i: ('GET', f'{API}/orders/', None)),
+        Scenario('order_create', lambda i: ('POST', f'{API}/orders/', order_body(i))),
+        Scenario('chat_append', lambda i: ('POST', f'{API}/chat-messages/', chat_body(i))),
+    ]
+
+
+class ClientTransport:
+    name = 'client'
+
+    def __init__(self):
+        self.client = Client()
+
+    def run(self, requests):
+        timings = []
+        for method, path, body in requests:
+            start = time.perf_counter()
+            if method == 'GET':
+                response = self.client.get(path)
+            else:
+                response = self.client.generic(method, path, json.dumps(body), content_type='application/json')
+            timings.append((time.perf_counter() - start, response.status_code))
+        return timings
+
+
+class ASGITransport:
+    """Drives the ASGI application directly with in-memory receive/send channels."""
+    name = 'asgi'
+
+    def __init__(self):
+        self.application = ASGIHandler()
+
+    def run(self, requests):
+        return asyncio.run(self._run(requests))
+
+    async def _run(self, requests):
+        timings = []
+        for method, path, body in requests:
+            start = time.perf_counter()
+            status = await self._request(method, path, body)
+            timings.append((time.perf_counter() - start, status))
+        return timings
+
+    async def _request(self, method, path, body):
+        payload = json.dumps(body).encode() if body is not None else b''
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(payload)).encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        pending = [{'type': 'http.request', 'body': payload, 'more_body': False}]
+        status = []
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            # No disconnect: the handler cancels this wait once the response is sent.
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await self.application(scope, receive, send)
+        return status[0]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q * len(ordered)) - 1))]
+
+
+def run_scenario(transport, scenario, iterations, warmup):
+    """Run one scenario and return its throughput, latency percentiles (ms) and query counts."""
+    transport.run([scenario.request(i) for i in range(warmup)])
+    requests = [scenario.request(warmup + i) for i in range(iterations)]
+    counts = []
+    with QueryCounter() as counter:
+        def count(**kwargs):
+            counts.append(counter.count)
+            counter.count = 0
+        # Registered after the counter's own receiver, so it reads the finished request's count.
+        request_finished.connect(count)
+        try:
+            start = time.perf_counter()
+            timings = transport.run(requests)
+            elapsed = time.perf_counter() - start
+        finally:
+            request_finished.disconnect(count)
+    latencies = [seconds * 1000 for seconds, _ in timings]
+    return {
+        'requests': iterations,
+        'errors': sum(1 for _, status in timings if status >= 400),
+        'throughput_rps': iterations / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'queries_mean': sum(counts) / len(counts) if counts else 0.0,
+        'queries_max': max(counts, default=0),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    List the regressions of results against a baseline run: a p95 latency or
+    throughput worse by more than threshold (a fraction), or more queries.
+    """
+    regressions = []
+    for transport, scenarios in results.items():
+        for name, current in scenarios.items():
+            previous = baseline.get(transport, {}).get(name)
+            if previous is None:
+                continue
+            label = f'{transport}/{name}'
+            if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+                regressions.append(f'{label}: p95 {previous["p95_ms"]:.2f} ms -> {current["p95_ms"]:.2f} ms')
+            if current['throughput_rps'] < previous['throughput_rps'] * (1 - threshold):
+                regressions.append(f'{label}: throughput {previous["throughput_rps"]:.1f} -> {current["throughput_rps"]:.1f} req/s')
+            if current['queries_mean'] > previous['queries_mean']:
+                regressions.append(f'{label}: queries/request {previous["queries_mean"]:.1f} -> {current["queries_mean"]:.1f}')
+    return regressions
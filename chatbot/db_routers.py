@@ -0,0 +1,45 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA_DB = 'replica'
+
+# Set while a read-only viewset action runs. Reads made anywhere else (admin,
+# management commands, the reads inside a write request) stay on the primary so
+# they always see their own writes.
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Send the ORM reads made inside the block to the read replica, if one is configured."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReadReplicaRouter:
+    """
+    Routes reads to the "replica" database inside replica_reads() blocks.
+    Writes, relations and migrations always go through "default".
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and REPLICA_DB in settings.DATABASES:
+            return REPLICA_DB
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_DB:
+            return False
+        return None
@@ -0,0 +1,177 @@
+"""
+Image pipeline for Product.image and UserProfile.profile_picture.
+
+Uploads are stored under a name derived from their content hash, so an
+identical upload reuses the existing file. After the upload is committed,
+resized WebP variants (settings.IMAGE_VARIANTS) are rendered in a process
+pool, written next to the original and recorded on the model's variants
+field, from which the serializers pick the variant a client asks for.
+"""
+import hashlib
+import io
+import logging
+import multiprocessing
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANTS = {
+    'thumbnail': (150, 150),
+    'medium': (600, 600),
+}
+WEBP_QUALITY = 80
+
+
+def image_variants():
+    return getattr(settings, 'IMAGE_VARIANTS', DEFAULT_VARIANTS)
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def hashed_name(name, digest):
+    directory = posixpath.dirname(name)
+    extension = posixpath.splitext(name)[1].lower()
+    return posixpath.join(directory, f'{digest}{extension}')
+
+
+def variant_name(name, variant):
+    """Storage name of a variant of the original stored as name."""
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, 'variants', f'{posixpath.splitext(filename)[0]}_{variant}.webp')
+
+
+@deconstructible
+class ContentHashedStorage(FileSystemStorage):
+    """
+    File system storage naming files after the hash of their content.
+    Saving content that is already stored returns the existing name without
+    writing anything.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = hashed_name(name, content_hash(content))
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def save_as(self, name, content):
+        """Save content under exactly this name (used for the derived variants)."""
+        return super().save(name, content)
+
+
+def render_variants(data, sizes):
+    """
+    Render the WebP variants of an image (runs in the worker processes).
+    Returns {variant: bytes}.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        rendered = {}
+        for variant, size in sizes.items():
+            copy = image.copy()
+            copy.thumbnail(tuple(size), Image.LANCZOS)
+            output = io.BytesIO()
+            copy.save(output, 'WEBP', quality=WEBP_QUALITY, method=4)
+            rendered[variant] = output.getvalue()
+    return rendered
+
+
+def store_variants(storage, name, rendered):
+    """Write rendered variants next to the original; return {variant: storage name}."""
+    names = {}
+    for variant, data in rendered.items():
+        names[variant] = variant_name(name, variant)
+        if not storage.exists(names[variant]):
+            storage.save_as(names[variant], ContentFile(data))
+    return names
+
+
+def existing_variants(storage, name):
+    """The variants of name that are already stored, or None if some are missing."""
+    names = {variant: variant_name(name, variant) for variant in image_variants()}
+    if all(storage.exists(path) for path in names.values()):
+        return names
+    return None
+
+
+def delete_image(model, field_name, name, variants=None):
+    """
+    Delete a stored image and its variants, unless another row still points
+    to the (deduplicated) file.
+    """
+    if not name or model._default_manager.filter(**{field_name: name}).exists():
+        return
+    storage = model._meta.get_field(field_name).storage
+    names = {name, *(variants or {}).values(), *(variant_name(name, variant) for variant in image_variants())}
+    for path in names:
+        storage.delete(path)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers=None):
+    """
+    The process-wide pool rendering the variants. Workers are spawned rather
+    than forked so they do not inherit database connections or server threads.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers or getattr(settings, 'IMAGE_PIPELINE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def record_variants(model, field_name, variants_field, name, variants):
+    # Every row pointing at the same (deduplicated) file gets the variants.
+    # update() skips save() and its signals, so this does not schedule again.
+    model._default_manager.filter(**{field_name: name}).update(**{variants_field: variants})
+
+
+def schedule_variants(model, field_name, variants_field, name):
+    """Render and record the variants of a stored image in the background."""
+    storage = model._meta.get_field(field_name).storage
+    variants = existing_variants(storage, name)
+    if variants is not None:
+        record_variants(model, field_name, variants_field, name, variants)
+        return
+    with storage.open(name, 'rb') as original:
+        data = original.read()
+    future = get_executor().submit(render_variants, data, image_variants())
+
+    def done(future):
+        try:
+            variants = store_variants(storage, name, future.result())
+            record_variants(model, field_name, variants_field, name, variants)
+        except Exception:
+            logger.exception('Could not generate the variants of %s', name)
+        finally:
+            # Runs in an executor thread, which must not keep its connection open.
+            connection.close()
+
+    future.add_done_callback(done)
+    return future
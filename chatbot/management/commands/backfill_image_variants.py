@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from chatbot import images
+from chatbot.signals import IMAGE_FIELDS
+from django.core.files.base import ContentFile
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import posixpath
+
+
+class Command(BaseCommand):
+    help = ('Move existing product images and profile pictures to content-hashed names '
+            'and generate their missing WebP variants')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Images rendered per batch')
+        parser.add_argument('--workers', type=int, default=None, help='Rendering processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that are already recorded')
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            for model, field_name, variants_field in IMAGE_FIELDS:
+                queryset = model._default_manager.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                if not options['force']:
+                    queryset = queryset.filter(**{variants_field: {}})
+                # Several rows can share one (deduplicated) file: process every distinct file once
+                names = sorted(set(queryset.values_list(field_name, flat=True)))
+                self.stdout.write(f'{model.__name__}.{field_name}: {len(names)} images to process')
+                done = 0
+                for offset in range(0, len(names), options['batch_size']):
+                    done += self.process_batch(executor, model, field_name, variants_field,
+                                               names[offset:offset + options['batch_size']], options['force'])
+                self.stdout.write(self.style.SUCCESS(f'{model.__name__}.{field_name}: {done} images processed'))
+
+    def process_batch(self, executor, model, field_name, variants_field, names, force):
+        storage = model._meta.get_field(field_name).storage
+        pending = {}
+        done = 0
+        for name in names:
+            if not storage.exists(name):
+                self.stderr.write(f'Missing file {name}, skipped')
+                continue
+            with storage.open(name, 'rb') as original:
+                data = original.read()
+            # Files uploaded before the pipeline existed are renamed after their content hash
+            digest = images.content_hash(ContentFile(data))
+            if posixpath.splitext(posixpath.basename(name))[0] != digest:
+                new_name = storage.save(name, ContentFile(data))
+                model._default_manager.filter(**{field_name: name}).update(**{field_name: new_name})
+                name = new_name
+            variants = None if force else images.existing_variants(storage, name)
+            if variants is not None:
+                images.record_variants(model, field_name, variants_field, name, variants)
+                done += 1
+            else:
+                pending[name] = executor.submit(images.render_variants, data, images.image_variants())
+        for name, future in pending.items():
+            try:
+                rendered = future.result()
+            except Exception as error:
+                self.stderr.write(f'Could not render {name}: {error}')
+                continue
+            if force:
+                # store_variants keeps existing files: remove the old ones first
+                for variant in rendered:
+                    path = images.variant_name(name, variant)
+                    if storage.exists(path):
+                        storage.delete(path)
+            variants = images.store_variants(storage, name, rendered)
+            images.record_variants(model, field_name, variants_field, name, variants)
+            done += 1
+        return done
@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand, CommandError
+# The WSGI handler runs the full request cycle, including the request_started/request_finished
+# signals that decide whether a database connection is closed or kept for the next request
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+import io
+import sys
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark requests/sec against an API endpoint with and without database connection reuse'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Number of measured requests per mode')
+        parser.add_argument('--warmup', type=int, default=20, help='Number of unmeasured requests per mode')
+        parser.add_argument('--path', default='/chatbot-api/products/', help='Path to request (GET)')
+        parser.add_argument('--database', default='default', help='Database alias to reconfigure')
+        parser.add_argument('--max-age', type=int, default=600, help='CONN_MAX_AGE used for the persistent mode')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in connections:
+            raise CommandError(f'Unknown database alias "{alias}"')
+        connection = connections[alias]
+        original = dict(connection.settings_dict)
+        original_options = dict(original.get('OPTIONS', {}))
+
+        # Each mode is a set of overrides applied to the connection settings before running
+        no_pool_options = {key: value for key, value in original_options.items() if key != 'pool'}
+        modes = [
+            ('no reuse', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': no_pool_options}),
+            ('persistent', {'CONN_MAX_AGE': options['max_age'], 'CONN_HEALTH_CHECKS': True, 'OPTIONS': no_pool_options}),
+        ]
+        # Django's native pool is only available on PostgreSQL with psycopg 3, and only benchmarked when configured
+        if original_options.get('pool'):
+            modes.append(('pool', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': original_options}))
+
+        # Count every new physical connection so the effect of reuse is visible next to the timings
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            if connection.alias == alias:
+                opened.append(1)
+
+        connection_created.connect(count_connection)
+        # Admission control would shed most of the requests of this single client
+        with override_settings(RATE_LIMITS={}, ENDPOINT_RATE_LIMITS={}, ADMISSION_CONCURRENCY={}):
+            handler = WSGIHandler()
+        self.stdout.write(f'Benchmarking GET {options["path"]} on "{alias}" ({original["ENGINE"]})')
+        try:
+            for name, overrides in modes:
+                self.configure(connection, overrides)
+                self.run(handler, options['path'], options['warmup'])
+                opened.clear()
+                elapsed, errors = self.run(handler, options['path'], options['requests'])
+                rps = options['requests'] / elapsed if elapsed else 0.0
+                self.stdout.write(self.style.SUCCESS(
+                    f'{name:>12}: {rps:9.1f} req/s, {elapsed * 1000 / options["requests"]:7.2f} ms/req, '
+                    f'{len(opened)} connections opened, {errors} errors'
+                ))
+        finally:
+            connection_created.disconnect(count_connection)
+            self.configure(connection, {key: original[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')} | {'OPTIONS': original_options})
+
+    # Close the current connection (and pool) so the next request connects with the new settings
+    def configure(self, connection, overrides):
+        connection.close()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+        connection.settings_dict.update(overrides)
+
+    # Send 'count' GET requests through the WSGI handler and return the elapsed time and error count
+    def run(self, handler, path, count):
+        path_info, _, query_string = path.partition('?')
+        errors = 0
+        start = time.perf_counter()
+        for _ in range(count):
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path_info,
+                'QUERY_STRING': query_string,
+                'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80',
+                'HTTP_HOST': 'localhost',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'wsgi.version': (1, 0),
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': io.BytesIO(b''),
+                'wsgi.errors': sys.stderr,
+                'wsgi.multithread': False,
+                'wsgi.multiprocess': True,
+                'wsgi.run_once': False,
+            }
+            response = handler(environ, lambda status, headers, exc_info=None: None)
+            if response.status_code >= 400:
+                errors += 1
+            # Closing the response fires request_finished, which closes or keeps the connection
+            response.close()
+        return time.perf_counter() - start, errors
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.nlp import TRAINING_EXAMPLES, CatalogMatcher, MessageAnalyzer
+from faker import Faker
+import random
+import time
+
+CATEGORIES = ['Electronics', 'Clothing', 'Books', 'Home', 'Sports', 'Food', 'Toys']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark batch intent classification and entity extraction throughput (messages/sec)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000, help='Number of messages to classify')
+        parser.add_argument('--batch-size', type=int, default=500, help='Messages per analyze_batch call')
+        parser.add_argument('--products', type=int, default=5000, help='Size of the synthetic catalog')
+        parser.add_argument('--from-db', action='store_true', help='Use the product catalog of the database')
+        parser.add_argument('--target', type=float, default=5000, help='Minimum messages/sec, the command fails below it')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for the synthetic catalog and messages')
+
+    def handle(self, *args, **options):
+        fake = Faker()
+        Faker.seed(options['seed'])
+        rng = random.Random(options['seed'])
+
+        # Build the catalog the same way generate_fake_data names its products
+        catalog = CatalogMatcher()
+        if options['from_db']:
+            catalog.load_from_db()
+            names = catalog.names()
+            if not names:
+                raise CommandError('The database has no products.')
+        else:
+            products = [
+                (index, f'{fake.word().capitalize()} {fake.word().capitalize()}', rng.choice(CATEGORIES))
+                for index in range(options['products'])
+            ]
+            catalog.load(products)
+            names = [name for _, name, _ in products]
+
+        # Messages are the training phrases with real names, categories, order ids and prices filled in
+        templates = [text for texts in TRAINING_EXAMPLES.values() for text in texts]
+        messages = []
+        for _ in range(options['messages']):
+            text = rng.choice(templates)
+            text = text.replace('__product__', rng.choice(names), 1).replace('__product__', rng.choice(names))
+            text = text.replace('__category__', rng.choice(CATEGORIES).lower())
+            text = text.replace('__order__', f'#{rng.randint(1, 99999)}')
+            text = text.replace('__price__', f'${rng.randint(5, 500)}')
+            messages.append(text)
+
+        start = time.perf_counter()
+        analyzer = MessageAnalyzer(catalog=catalog)
+        analyzer.analyze_batch(messages[:1], check_db=False)
+        setup = time.perf_counter() - start
+        self.stdout.write(f'Training and automaton compilation: {setup * 1000:.1f} ms')
+
+        start = time.perf_counter()
+        for offset in range(0, len(messages), options['batch_size']):
+            analyzer.analyze_batch(messages[offset:offset + options['batch_size']], check_db=False)
+        elapsed = time.perf_counter() - start
+        rate = len(messages) / elapsed if elapsed else float('inf')
+
+        summary = f'{len(messages)} messages in {elapsed:.2f} s: {rate:.0f} messages/sec (target {options["target"]:.0f})'
+        if rate < options['target']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
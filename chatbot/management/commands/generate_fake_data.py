@@ -4,6 +4,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 # Import all the models from the chatbot app that we'll be populating with fake data
 from chatbot.models import UserProfile, Product, Order, ChatSession, ChatMessage
+from chatbot.orders import place_order
 # Import the Faker library which generates realistic fake data like names, addresses, etc.
 from faker import Faker
 # Import random module for generating random values and making random selections
@@ -39,6 +40,8 @@ class Command(BaseCommand):
         parser.add_argument('--chats', type=int, default=20, help='Number of chat sessions to create')
         # Add argument for number of messages per chat session, with a default value of 5
         parser.add_argument('--messages', type=int, default=5, help='Number of messages per chat session')
+        # Add argument for seeding the random generators, so the same seed always generates the same dataset
+        parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible data generation')
 
     # The main method that gets called when the command is executed
     def handle(self, *args, **options):
@@ -49,6 +52,11 @@ class Command(BaseCommand):
         num_chats = options['chats']
         num_messages = options['messages']
 
+        # Seed both Faker and the random module when a seed is given, making the generated data reproducible
+        if options['seed'] is not None:
+            Faker.seed(options['seed'])
+            random.seed(options['seed'])
+
         # Print a message indicating that the data generation process is starting
         # self.style.SUCCESS applies a green color to the text in the terminal
         self.stdout.write(self.style.SUCCESS(f'Starting to generate fake data...'))
@@ -165,24 +173,20 @@ class Command(BaseCommand):
             user = random.choice(users)
             # Randomly select 1-5 products from the list of products
             order_products = random.sample(products, k=random.randint(1, 5))
-            # Calculate the total price by summing the prices of all selected products
-            total_price = sum(product.price for product in order_products)
             
-            # Create a new Order instance with the selected user and calculated total price
-            order = Order(
+            # Create the order with one line item (1-3 units) per selected product; the total price
+            # is computed from the line items and the user's order summary is updated with it
+            order = place_order(
                 # Set the user who placed the order
                 user=user,
+                # Each line item snapshots the current price of its product
+                items=[{'product': product, 'quantity': random.randint(1, 3)} for product in order_products],
                 # Randomly select an order status from the OrderStatus enum
                 status=random.choice([Order.OrderStatus.PENDING, Order.OrderStatus.SHIPPED, Order.OrderStatus.COMPLETED]),
-                # Set the total price of the order
-                total_price=total_price,
-                # Generate a random order date within the last year
-                order_date=fake.date_time_between(start_date='-1y', end_date='now')
             )
-            # Save the order to the database
-            order.save()
-            # Associate the selected products with this order using the many-to-many relationship
-            order.products.set(order_products)
+            # Generate a random order date within the last year (order_date is set automatically on creation)
+            order.order_date = fake.date_time_between(start_date='-1y', end_date='now', tzinfo=timezone.get_current_timezone())
+            order.save(update_fields=['order_date'])
             # Add the order to our list of created orders
             orders.append(order)
         # Return the list of created orders
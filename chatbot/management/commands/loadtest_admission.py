@@ -0,0 +1,110 @@
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+from django.test import RequestFactory, override_settings
+from chatbot.benchmarks import percentile
+from chatbot.middleware import AdmissionControlMiddleware
+import threading
+import time
+
+
+# Admission control treating every user the same, as the baseline to compare against
+class FifoAdmissionControlMiddleware(AdmissionControlMiddleware):
+    def priority(self, premium):
+        return 1
+
+
+# The simulated clients are not in the database: each request carries its (identity, premium)
+class SimulatedClientMixin:
+    def client(self, request):
+        return request.simulated_client
+
+
+class LoadTestAdmissionControlMiddleware(SimulatedClientMixin, AdmissionControlMiddleware):
+    pass
+
+
+class LoadTestFifoAdmissionControlMiddleware(SimulatedClientMixin, FifoAdmissionControlMiddleware):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Load test the admission control: premium chat latency while an increasing number of '
+            'free-tier clients saturate the chat endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Chat requests served at once')
+        parser.add_argument('--service-time', type=float, default=0.02, help='Seconds spent serving one chat turn')
+        parser.add_argument('--premium-clients', type=int, default=2, help='Premium clients (one request at a time)')
+        parser.add_argument('--think-time', type=float, default=0.05, help='Pause of premium clients between requests')
+        parser.add_argument('--free-clients', type=int, nargs='+', default=[0, 4, 16, 64],
+                            help='Free-tier client counts to run, each one a load level')
+        parser.add_argument('--duration', type=float, default=3.0, help='Seconds per load level')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{options["concurrency"]} slots, {options["service_time"] * 1000:.0f} ms per chat turn, '
+                          f'{options["premium_clients"]} premium clients')
+        self.stdout.write(f'{"mode":<9} {"free":>5} {"premium p50":>12} {"premium p99":>12} '
+                          f'{"free p99":>9} {"free shed":>10} {"premium shed":>13}')
+        for free_clients in options['free_clients']:
+            for mode, middleware_class in (('priority', LoadTestAdmissionControlMiddleware),
+                                           ('fifo', LoadTestFifoAdmissionControlMiddleware)):
+                results = self.run_level(middleware_class, free_clients, options)
+                self.stdout.write(
+                    f'{mode:<9} {free_clients:>5} {results["premium_p50"]:>9.1f} ms {results["premium_p99"]:>9.1f} ms '
+                    f'{results["free_p99"]:>6.1f} ms {results["free_shed"]:>9.0%} {results["premium_shed"]:>12.0%}'
+                )
+
+    def run_level(self, middleware_class, free_clients, options):
+        service_time = options['service_time']
+
+        # The view only takes time, so the measured latency is the admission control plus the service time
+        def view(request):
+            time.sleep(service_time)
+            return JsonResponse({'message_type': 'BOT', 'content': 'ok'})
+
+        # Only the concurrency limit is active: per-user buckets would shed the free clients before they queue
+        with override_settings(RATE_LIMITS={}, ENDPOINT_RATE_LIMITS={}, RATE_LIMIT_STORE_PATH='',
+                               ADMISSION_CONCURRENCY={'chat': options['concurrency']}):
+            middleware = middleware_class(view)
+
+        factory = RequestFactory()
+        latencies = {True: [], False: []}
+        shed = {True: 0, False: 0}
+        lock = threading.Lock()
+        stop = time.perf_counter() + options['duration']
+
+        def client(user_id, premium):
+            while time.perf_counter() < stop:
+                request = factory.post('/chatbot-api/chat-messages/')
+                request.simulated_client = (f'user:{user_id}', premium)
+                start = time.perf_counter()
+                response = middleware(request)
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    if response.status_code == 429:
+                        shed[premium] += 1
+                    else:
+                        latencies[premium].append(elapsed)
+                if response.status_code == 429:
+                    time.sleep(float(response['Retry-After']) / 10)
+                elif premium:
+                    time.sleep(options['think_time'])
+
+        threads = [threading.Thread(target=client, args=(index, True)) for index in range(options['premium_clients'])]
+        threads += [threading.Thread(target=client, args=(1000 + index, False)) for index in range(free_clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        def shed_rate(premium):
+            total = shed[premium] + len(latencies[premium])
+            return shed[premium] / total if total else 0.0
+
+        return {
+            'premium_p50': percentile(latencies[True], 0.50) if latencies[True] else 0.0,
+            'premium_p99': percentile(latencies[True], 0.99) if latencies[True] else 0.0,
+            'free_p99': percentile(latencies[False], 0.99) if latencies[False] else 0.0,
+            'free_shed': shed_rate(False),
+            'premium_shed': shed_rate(True),
+        }
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.models import PurgeJob
+from chatbot.purge import UserPurger, queue_purge, unfinished_jobs
+
+
+class Command(BaseCommand):
+    help = ('Delete or anonymize users with their orders, chat sessions and messages in small throttled batches. '
+            'Interrupted or queued jobs are resumed with --pending (e.g. from cron).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help='Users to purge')
+        parser.add_argument('--anonymize', action='store_true',
+                            help='Scrub the personal data and chat contents but keep the orders')
+        parser.add_argument('--pending', action='store_true', help='Run the queued and unfinished purge jobs')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows deleted or scrubbed per transaction')
+        parser.add_argument('--pause', type=float, default=0.05, help='Seconds to sleep between two chunks')
+
+    def handle(self, *args, **options):
+        if not options['user_ids'] and not options['pending']:
+            raise CommandError('Give user ids to purge, or --pending to run the queued jobs')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        mode = PurgeJob.Mode.ANONYMIZE if options['anonymize'] else PurgeJob.Mode.DELETE
+        jobs = [queue_purge(user_id, mode) for user_id in options['user_ids']]
+        if options['pending']:
+            jobs += [job for job in unfinished_jobs() if job not in jobs]
+
+        purger = UserPurger(options['chunk_size'], options['pause'],
+                            stdout=self.stdout if options['verbosity'] > 1 else None)
+        failed = 0
+        for job in jobs:
+            try:
+                if purger.run(job) is None:
+                    self.stdout.write(f'{job}: run by another worker, skipped')
+                    continue
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(self.style.ERROR(f'{job}: failed in phase {job.phase}: {exc}'))
+                continue
+            summary = ', '.join(f'{phase} {count}' for phase, count in job.progress.items()) or 'nothing to do'
+            self.stdout.write(self.style.SUCCESS(f'{job}: {summary}'))
+        if failed:
+            raise CommandError(f'{failed} purge job(s) failed; run again with --pending to resume')
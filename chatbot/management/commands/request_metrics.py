@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+import re
+import urllib.request
+
+# One sample line of the Prometheus text format: name{labels} value
+SAMPLE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>.*)\})?\s+(?P<value>\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+class Command(BaseCommand):
+    help = 'Print the per-view request metrics exposed by a running server on /chatbot-api/metrics/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/chatbot-api/metrics/',
+                            help='Metrics endpoint to scrape')
+        parser.add_argument('--sort', default='p99', choices=['count', 'p50', 'p95', 'p99', 'queries'],
+                            help='Column used to sort the views (descending)')
+
+    def handle(self, *args, **options):
+        try:
+            with urllib.request.urlopen(options['url'], timeout=10) as response:
+                text = response.read().decode()
+        except OSError as error:
+            raise CommandError(f'Could not read {options["url"]}: {error}')
+
+        # Group the samples by (view, action)
+        views = {}
+        for line in text.splitlines():
+            match = SAMPLE.match(line)
+            if line.startswith('#') or not match:
+                continue
+            labels = dict(LABEL.findall(match['labels'] or ''))
+            key = (labels.pop('view', ''), labels.pop('action', ''))
+            name = match['name']
+            if 'quantile' in labels:
+                name += '@' + labels['quantile']
+            views.setdefault(key, {})[name] = float(match['value'])
+
+        rows = []
+        for (view, action), values in views.items():
+            rows.append({
+                'view': f'{view}.{action}',
+                'count': int(values.get('chatbot_request_duration_seconds_count', 0)),
+                'p50': values.get('chatbot_request_duration_seconds@0.5', 0) * 1000,
+                'p95': values.get('chatbot_request_duration_seconds@0.95', 0) * 1000,
+                'p99': values.get('chatbot_request_duration_seconds@0.99', 0) * 1000,
+                'queries': values.get('chatbot_request_db_queries@0.99', 0),
+                'db': values.get('chatbot_request_db_duration_seconds@0.99', 0) * 1000,
+                'serialization': values.get('chatbot_request_serialization_seconds@0.99', 0) * 1000,
+                'size': values.get('chatbot_response_size_bytes@0.99', 0),
+                'n_plus_one': int(values.get('chatbot_n_plus_one_total', 0)),
+            })
+        rows.sort(key=lambda row: row[options['sort']], reverse=True)
+
+        self.stdout.write(f'{"view.action":<50} {"count":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+                          f'{"queries":>8} {"db ms":>8} {"ser ms":>8} {"bytes":>9} {"N+1":>5}')
+        for row in rows:
+            line = (f'{row["view"]:<50} {row["count"]:>7} {row["p50"]:>8.2f} {row["p95"]:>8.2f} {row["p99"]:>8.2f} '
+                    f'{row["queries"]:>8.0f} {row["db"]:>8.2f} {row["serialization"]:>8.2f} {row["size"]:>9.0f} '
+                    f'{row["n_plus_one"]:>5}')
+            self.stdout.write(self.style.WARNING(line) if row['n_plus_one'] else line)
+        self.stdout.write('Latency columns are per-request percentiles; queries, db, ser and bytes are p99 values.')
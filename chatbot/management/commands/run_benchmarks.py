@@ -0,0 +1,104 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from chatbot.benchmarks import ASGITransport, ClientTransport, build_scenarios, compare, run_scenario
+from datetime import datetime, timezone
+import django
+import io
+import json
+import platform
+
+TRANSPORTS = {'client': ClientTransport, 'asgi': ASGITransport}
+
+
+class Command(BaseCommand):
+    help = ('Run the end-to-end API benchmarks against a freshly seeded test database, '
+            'write the results to JSON and optionally fail on regressions against a baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1,
+                            help='Dataset scale: multiplies the generate_fake_data default counts')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for the dataset and the request sequence')
+        parser.add_argument('--iterations', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario')
+        parser.add_argument('--transport', choices=['client', 'asgi', 'all'], default='all',
+                            help='Run through the test client, the ASGI application or both')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run the named scenario (can be repeated)')
+        parser.add_argument('--output', default='benchmark_results.json', help='File the JSON results are written to')
+        parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+        parser.add_argument('--threshold', type=float, default=0.20,
+                            help='Allowed p95/throughput regression against the baseline, as a fraction')
+        parser.add_argument('--metrics-sample-rate', type=float, default=0.0,
+                            help='REQUEST_METRICS_SAMPLE_RATE used while benchmarking (off by default)')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        # Run against a throw-away test database so the benchmark never touches real data
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.seed(options['scale'], options['seed'], options['verbosity'])
+            # Admission control is off: the benchmark is a single client measuring the endpoints themselves
+            with override_settings(REQUEST_METRICS_SAMPLE_RATE=options['metrics_sample_rate'],
+                                   RATE_LIMITS={}, ENDPOINT_RATE_LIMITS={}, ADMISSION_CONCURRENCY={}):
+                results = self.run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'date': datetime.now(timezone.utc).isoformat(),
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+                'metrics_sample_rate': options['metrics_sample_rate'],
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+        if baseline is not None:
+            regressions = compare(results, baseline['results'], options['threshold'])
+            if regressions:
+                raise CommandError('Benchmark regressions:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    # Seed the deterministic dataset through generate_fake_data (with a fast password hasher)
+    def seed(self, scale, seed, verbosity):
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+            call_command('generate_fake_data', users=10 * scale, products=50 * scale, orders=30 * scale,
+                         chats=20 * scale, messages=5, seed=seed,
+                         stdout=self.stdout if verbosity > 1 else io.StringIO())
+
+    def run(self, options):
+        names = ['client', 'asgi'] if options['transport'] == 'all' else [options['transport']]
+        results = {}
+        for name in names:
+            transport = TRANSPORTS[name]()
+            # Rebuild the scenarios for every transport so each one replays the same request sequence
+            scenarios = build_scenarios(options['seed'])
+            if options['scenarios']:
+                scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+            results[name] = {}
+            for scenario in scenarios:
+                result = run_scenario(transport, scenario, options['iterations'], options['warmup'])
+                results[name][scenario.name] = result
+                self.stdout.write(
+                    f'{name:>6} {scenario.name:<15} {result["throughput_rps"]:8.1f} req/s  '
+                    f'p50 {result["p50_ms"]:7.2f}  p95 {result["p95_ms"]:7.2f}  p99 {result["p99_ms"]:7.2f} ms  '
+                    f'{result["queries_mean"]:5.1f} queries  {result["errors"]} errors'
+                )
+        return results
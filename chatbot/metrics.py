@@ -0,0 +1,143 @@
+import threading
+from contextvars import ContextVar
+
+# Per-request recorder of the request being sampled (None when not sampled),
+# so code outside the middleware (serializers) can add its timings to it.
+current_request_metrics = ContextVar('current_request_metrics', default=None)
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+
+class Histogram:
+    """
+    HDR-style log-linear histogram of non-negative integers.
+
+    Values below 2 * 2**precision_bits are counted exactly; above that every
+    power-of-two range is split into 2**precision_bits buckets, which bounds
+    the relative error of any reported quantile to 2**-precision_bits
+    (about 3% with the default 5 bits) whatever the value range.
+    """
+
+    def __init__(self, precision_bits=5):
+        self.precision_bits = precision_bits
+        self.sub_buckets = 1 << precision_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value):
+        if value < 2 * self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.precision_bits - 1
+        return (shift << self.precision_bits) + (value >> shift)
+
+    def _highest_value(self, index):
+        if index < 2 * self.sub_buckets:
+            return index
+        shift = index // self.sub_buckets - 1
+        mantissa = index - shift * self.sub_buckets
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(0, int(value))
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = max(1, round(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._highest_value(index), self.max)
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    In-memory, per-process store of the request histograms and counters,
+    rendered in the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> (help, unit scale, {labels: Histogram})
+        self._histograms = {}
+        # name -> (help, {labels: int})
+        self._counters = {}
+
+    def describe_histogram(self, name, help_text, scale=1):
+        self._histograms.setdefault(name, (help_text, scale, {}))
+
+    def describe_counter(self, name, help_text):
+        self._counters.setdefault(name, (help_text, {}))
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            series = self._histograms[name][2]
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.record(value)
+
+    def increment(self, name, labels, amount=1):
+        with self._lock:
+            series = self._counters[name][1]
+            series[labels] = series.get(labels, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            for _, _, series in self._histograms.values():
+                series.clear()
+            for _, series in self._counters.values():
+                series.clear()
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, scale, series) in self._histograms.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} summary')
+                for labels, histogram in sorted(series.items()):
+                    for q in QUANTILES:
+                        quantile_labels = labels + (('quantile', str(q)),)
+                        lines.append(f'{name}{_format_labels(quantile_labels)} {_format_value(histogram.quantile(q) * scale)}')
+                    lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram.total * scale)}')
+                    lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+            for name, (help_text, series) in self._counters.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in sorted(series.items()):
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def _format_value(value):
+    return f'{value:.6g}' if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+registry.describe_histogram('chatbot_request_duration_seconds', 'Wall time of sampled requests.', scale=1e-6)
+registry.describe_histogram('chatbot_request_db_queries', 'Database queries per sampled request.')
+registry.describe_histogram('chatbot_request_db_duration_seconds', 'Database time per sampled request.', scale=1e-6)
+registry.describe_histogram('chatbot_request_serialization_seconds', 'Serializer and renderer time per sampled request.', scale=1e-6)
+registry.describe_histogram('chatbot_response_size_bytes', 'Response body size of sampled requests.')
+registry.describe_counter('chatbot_requests_sampled_total', 'Requests recorded by the metrics middleware.')
+registry.describe_counter('chatbot_requests_shed_total', 'Requests refused with a 429 by the admission control.')
+registry.describe_counter('chatbot_n_plus_one_total', 'Sampled requests repeating one SQL shape over the N+1 threshold.')
@@ -0,0 +1,270 @@
+import json
+import logging
+import math
+import random
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.db import connections
+from django.http import JsonResponse
+
+from .admission import MemoryTokenBucketStore, PriorityLimiter, SQLiteTokenBucketStore
+from .metrics import current_request_metrics, registry
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def sql_shape(sql):
+    """Reduce a SQL statement to its shape: literals, placeholders and IN lists collapsed."""
+    shape = _STRING_LITERAL.sub('?', sql)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(...)', shape.replace('%s', '?'))
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class RequestMetrics:
+    """Timings collected for one sampled request."""
+
+    def __init__(self):
+        self.view = 'unresolved'
+        self.action = ''
+        self.query_count = 0
+        self.query_time = 0.0
+        self.serialization_time = 0.0
+        # Timed serializers being run (see chatbot.serializers.TimedSerializerMixin)
+        self.serialization_depth = 0
+        self.shapes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper (see Connection.execute_wrapper).
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - start
+            self.query_count += 1
+            shape = sql_shape(sql)
+            self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+
+class RequestMetricsMiddleware:
+    """
+    Records wall time, query count and time, serialization time and response
+    size of a sample of the requests, per view and action (for instance
+    ProductViewSet.get_products_by_name), into the histograms of
+    chatbot.metrics.registry. Requests repeating one SQL shape at least
+    REQUEST_METRICS_N_PLUS_ONE_THRESHOLD times are logged as N+1 suspects.
+
+    Only REQUEST_METRICS_SAMPLE_RATE of the requests are recorded; the others
+    only pay for one random() call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 1.0)
+        self.n_plus_one_threshold = getattr(settings, 'REQUEST_METRICS_N_PLUS_ONE_THRESHOLD', 10)
+
+    def __call__(self, request):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_request_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_request_metrics.reset(token)
+        wall_time = time.perf_counter() - start
+
+        # The metrics endpoint itself is not worth recording.
+        if getattr(request, 'skip_request_metrics', False):
+            return response
+        self.record(metrics, wall_time, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_request_metrics.get()
+        if metrics is None:
+            return None
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if view_class is not None:
+            metrics.view = view_class.__name__
+        else:
+            metrics.view = getattr(view_func, '__qualname__', type(view_func).__name__)
+        # DRF viewsets map the HTTP method to the action (list, retrieve, get_products_by_name...).
+        actions = getattr(view_func, 'actions', None) or {}
+        metrics.action = actions.get(request.method.lower(), request.method.lower())
+        return None
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns: time the renderer too.
+        metrics = current_request_metrics.get()
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                metrics.serialization_time += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def record(self, metrics, wall_time, response):
+        labels = (('view', metrics.view), ('action', metrics.action))
+        if response.streaming:
+            size = int(response.get('Content-Length', 0))
+        else:
+            size = len(response.content)
+        registry.increment('chatbot_requests_sampled_total', labels)
+        registry.observe('chatbot_request_duration_seconds', labels, wall_time * 1e6)
+        registry.observe('chatbot_request_db_queries', labels, metrics.query_count)
+        registry.observe('chatbot_request_db_duration_seconds', labels, metrics.query_time * 1e6)
+        registry.observe('chatbot_request_serialization_seconds', labels, metrics.serialization_time * 1e6)
+        registry.observe('chatbot_response_size_bytes', labels, size)
+
+        repeated = [(shape, count) for shape, count in metrics.shapes.items() if count >= self.n_plus_one_threshold]
+        if repeated:
+            registry.increment('chatbot_n_plus_one_total', labels)
+            for shape, count in repeated:
+                logger.warning('Possible N+1 in %s.%s: query repeated %d times: %s',
+                               metrics.view, metrics.action, count, shape)
+
+
+class AdmissionControlMiddleware:
+    """
+    Rate limits and admission control for the API endpoints listed in
+    ADMISSION_ENDPOINTS ({endpoint: [URL prefixes]}).
+
+    - every user (or client IP when the request names none) has a token
+      bucket per endpoint, sized by tier in RATE_LIMITS ({endpoint:
+      {'free'|'premium': (tokens per second, burst)}});
+    - free-tier requests also draw from an endpoint-wide bucket
+      (ENDPOINT_RATE_LIMITS), so a free-tier flood is shed before it reaches
+      the views while premium users keep their own allowance;
+    - endpoints in ADMISSION_CONCURRENCY are limited to that many concurrent
+      requests per process, and queued requests are admitted premium first.
+
+    Refused requests get an immediate 429 with a Retry-After header. Buckets
+    live in a SQLite file (RATE_LIMIT_STORE_PATH) shared by the workers of the
+    host, or in memory when the path is empty.
+
+    The API has no login of its own: the customer is the UserProfile named by
+    the JSON body of a write ('user', or the user of 'chat_session'), and the
+    tier is their is_premium_user. Lookups are kept for ADMISSION_TIER_TTL
+    seconds per process, so a tier change takes effect within that delay.
+    """
+
+    max_cached_clients = 10000
+    max_retry_after = 3600
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.endpoints = [
+            (prefix, endpoint)
+            for endpoint, prefixes in getattr(settings, 'ADMISSION_ENDPOINTS', {}).items()
+            for prefix in prefixes
+        ]
+        self.rate_limits = getattr(settings, 'RATE_LIMITS', {})
+        self.endpoint_rate_limits = getattr(settings, 'ENDPOINT_RATE_LIMITS', {})
+        self.queue_timeout = getattr(settings, 'ADMISSION_QUEUE_TIMEOUT', 2.0)
+        self.limiters = {
+            endpoint: PriorityLimiter(slots, max_queue=getattr(settings, 'ADMISSION_MAX_QUEUE', 64))
+            for endpoint, slots in getattr(settings, 'ADMISSION_CONCURRENCY', {}).items()
+        }
+        path = getattr(settings, 'RATE_LIMIT_STORE_PATH', None)
+        self.store = SQLiteTokenBucketStore(path) if path else MemoryTokenBucketStore()
+        self.tier_ttl = getattr(settings, 'ADMISSION_TIER_TTL', 60.0)
+        # (field, id): (expiry, user id, premium)
+        self.clients = {}
+
+    def __call__(self, request):
+        endpoint = next((endpoint for prefix, endpoint in self.endpoints if request.path.startswith(prefix)), None)
+        if endpoint is None:
+            return self.get_response(request)
+
+        identity, premium = self.client(request)
+        tier = 'premium' if premium else 'free'
+
+        limit = self.rate_limits.get(endpoint, {}).get(tier)
+        if limit is not None:
+            allowed, retry_after = self.store.take(f'{identity}:{endpoint}', *limit)
+            if not allowed:
+                return self.too_many_requests(endpoint, tier, 'rate', retry_after)
+        limit = self.endpoint_rate_limits.get(endpoint)
+        if limit is not None and not premium:
+            allowed, retry_after = self.store.take(f'endpoint:{endpoint}', *limit)
+            if not allowed:
+                return self.too_many_requests(endpoint, tier, 'endpoint_rate', retry_after)
+
+        limiter = self.limiters.get(endpoint)
+        if limiter is None:
+            return self.get_response(request)
+        if not limiter.acquire(self.priority(premium), self.queue_timeout):
+            return self.too_many_requests(endpoint, tier, 'concurrency', 1)
+        try:
+            return self.get_response(request)
+        finally:
+            limiter.release()
+
+    def client(self, request):
+        """(bucket identity, premium) of the customer making the request."""
+        user = self.customer(request)
+        if user is not None:
+            return f'user:{user[0]}', user[1]
+        if getattr(request, 'user', None) is not None and request.user.is_authenticated:
+            # Staff signed in to the admin: not customers, free tier
+            return f'auth:{request.user.pk}', False
+        return f'ip:{request.META.get("REMOTE_ADDR", "")}', False
+
+    def customer(self, request):
+        # (user id, premium) of the UserProfile named by a JSON write, or None
+        if request.method in ('GET', 'HEAD', 'OPTIONS') or request.content_type != 'application/json':
+            return None
+        try:
+            data = json.loads(request.body)
+        except (RequestDataTooBig, ValueError):
+            # Left for the view to reject
+            return None
+        if not isinstance(data, dict):
+            return None
+        for field, query in (('user', 'pk'), ('chat_session', 'chats')):
+            value = data.get(field)
+            if isinstance(value, int) and not isinstance(value, bool):
+                return self.lookup(field, query, value)
+        return None
+
+    def lookup(self, field, query, value):
+        now = time.monotonic()
+        cached = self.clients.get((field, value))
+        if cached is not None and cached[0] > now:
+            return cached[1:]
+        user = UserProfile.objects.filter(**{query: value}).values_list('pk', 'is_premium_user').first()
+        if user is None:
+            return None
+        if len(self.clients) >= self.max_cached_clients:
+            self.clients.clear()
+        self.clients[(field, value)] = (now + self.tier_ttl, *user)
+        return user
+
+    def priority(self, premium):
+        # Lower values are admitted first.
+        return 0 if premium else 1
+
+    def too_many_requests(self, endpoint, tier, reason, retry_after):
+        registry.increment('chatbot_requests_shed_total', (('endpoint', endpoint), ('tier', tier), ('reason', reason)))
+        response = JsonResponse({'message': 'Too many requests, please retry later.'}, status=429)
+        # A bucket with a refill rate of 0 never refills (infinite retry_after): ask for the longest delay
+        response['Retry-After'] = str(max(1, math.ceil(min(retry_after, self.max_retry_after))))
+        return response
@@ -0,0 +1,161 @@
+# Generated by Django 5.2 on 2026-10-19 01:30
+
+import django.contrib.auth.models
+import django.contrib.auth.validators
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, validators=[django.core.validators.MinLengthValidator(3, message='Product name must be at least 3 characters long.'), django.core.validators.MaxLengthValidator(255, message='Product name cannot exceed 255 characters.'), django.core.validators.RegexValidator(message='Product name can only contain letters, numbers, spaces, hyphens, and underscores.', regex='^[a-zA-Z0-9\\s\\-_]+$')])),
+                ('description', models.TextField(validators=[django.core.validators.MinLengthValidator(10, message='Description must be at least 10 characters long.'), django.core.validators.MaxLengthValidator(2000, message='Description cannot exceed 2000 characters.')])),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0, message='Price cannot be negative.'), django.core.validators.MaxValueValidator(999999.99, message='Price cannot exceed 999,999.99.')])),
+                ('stock_quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(0, message='Stock quantity cannot be negative.'), django.core.validators.MaxValueValidator(999999, message='Stock quantity cannot exceed 999,999.')])),
+                ('category', models.CharField(max_length=255, validators=[django.core.validators.MinLengthValidator(2, message='Category must be at least 2 characters long.'), django.core.validators.MaxLengthValidator(100, message='Category cannot exceed 100 characters.'), django.core.validators.RegexValidator(message='Category can only contain letters and spaces.', regex='^[a-zA-Z\\s]+$')])),
+                ('image', models.ImageField(blank=True, null=True, upload_to='products/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'gif'], message='Only JPG, JPEG, PNG and GIF files are allowed.')])),
+                ('manifacturing_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Product',
+                'verbose_name_plural': 'Products',
+                'db_table': 'products',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['name'], name='products_name_6f9890_idx'), models.Index(fields=['category'], name='products_categor_fce6e6_idx'), models.Index(fields=['price'], name='products_price_fe467e_idx'), models.Index(fields=['stock_quantity'], name='products_stock_q_5d82ff_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('stock_quantity__gte', 0)), name='positive_stock_quantity'), models.CheckConstraint(condition=models.Q(('price__gte', 0)), name='positive_price')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(error_messages={'unique': 'A user with that username already exists.'}, help_text='Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.', max_length=150, unique=True, validators=[django.contrib.auth.validators.UnicodeUsernameValidator()], verbose_name='username')),
+                ('first_name', models.CharField(blank=True, max_length=150, verbose_name='first name')),
+                ('last_name', models.CharField(blank=True, max_length=150, verbose_name='last name')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='email address')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('address', models.TextField(blank=True, null=True, validators=[django.core.validators.MinLengthValidator(10, message='Address must be at least 10 characters long.'), django.core.validators.MaxLengthValidator(500, message='Address cannot exceed 500 characters.')])),
+                ('phone_number', models.CharField(blank=True, max_length=15, null=True, validators=[django.core.validators.RegexValidator(message="Phone number must be between 10 to 15 digits, optionally starting with '+'.", regex='^\\+?[0-9]{10,15}$')])),
+                ('preferred_categories', models.CharField(blank=True, max_length=255, null=True, validators=[django.core.validators.RegexValidator(message='Categories can only contain letters, numbers, spaces, and commas.', regex='^[a-zA-Z0-9\\s,]+$')])),
+                ('birth_date', models.DateField(blank=True, null=True)),
+                ('profile_picture', models.ImageField(blank=True, null=True, upload_to='profiles/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['jpg', 'jpeg', 'png', 'gif'], message='Only JPG, JPEG, PNG and GIF files are allowed.')])),
+                ('is_premium_user', models.BooleanField(default=False)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_profiles', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_profiles', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'verbose_name': 'User Profile',
+                'verbose_name_plural': 'User Profiles',
+                'db_table': 'user_profiles',
+                'ordering': ['-date_joined'],
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_date', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SHIPPED', 'Shipped'), ('COMPLETED', 'Completed')], default='PENDING', max_length=20, validators=[django.core.validators.RegexValidator(message='Invalid order status.', regex='^(PENDING|SHIPPED|COMPLETED)$')])),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0, message='Total price cannot be negative.'), django.core.validators.MaxValueValidator(999999.99, message='Total price cannot exceed 999,999.99.')])),
+                ('products', models.ManyToManyField(related_name='orders', to='chatbot.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='chatbot.userprofile')),
+            ],
+            options={
+                'verbose_name': 'Order',
+                'verbose_name_plural': 'Orders',
+                'db_table': 'orders',
+                'ordering': ['-order_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChatSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('products', models.ManyToManyField(blank=True, related_name='chat_sessions', to='chatbot.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chats', to='chatbot.userprofile')),
+            ],
+            options={
+                'verbose_name': 'Chat Session',
+                'verbose_name_plural': 'Chat Sessions',
+                'db_table': 'chat_sessions',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_type', models.CharField(choices=[('USER', 'User'), ('BOT', 'Bot')], max_length=10, validators=[django.core.validators.RegexValidator(message='Invalid message type.', regex='^(USER|BOT)$')])),
+                ('content', models.TextField(validators=[django.core.validators.MinLengthValidator(1, message='Message cannot be empty.'), django.core.validators.MaxLengthValidator(5000, message='Message cannot exceed 5000 characters.')])),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('chat_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='chatbot.chatsession')),
+            ],
+            options={
+                'verbose_name': 'Chat Message',
+                'verbose_name_plural': 'Chat Messages',
+                'db_table': 'chat_messages',
+                'ordering': ['timestamp'],
+                'indexes': [models.Index(fields=['timestamp'], name='chat_messag_timesta_93c8bf_idx'), models.Index(fields=['chat_session'], name='chat_messag_chat_se_719d31_idx'), models.Index(fields=['message_type'], name='chat_messag_message_b8fb34_idx')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['username'], name='user_profil_usernam_94e394_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['email'], name='user_profil_email_8a1024_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['is_premium_user'], name='user_profil_is_prem_1a7041_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date'], name='orders_order_d_6e39a9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status'], name='orders_status_762191_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user'], name='orders_user_id_4e08b8_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.CheckConstraint(condition=models.Q(('total_price__gte', 0)), name='positive_total_price'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['timestamp'], name='chat_sessio_timesta_55744d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user'], name='chat_sessio_user_id_54b88f_idx'),
+        ),
+    ]
@@ -0,0 +1,133 @@
+# Generated by Django 5.2 on 2026-10-19 01:15
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+
+
+def _columns(model, *names):
+    return [model._meta.get_field(name).column for name in names]
+
+
+def copy_line_items(apps, schema_editor):
+    # One line item per row of the old orders_products table. The price paid
+    # was never recorded: the current product price is the best snapshot left.
+    # Order totals are kept as they are, since they are what was charged.
+    Order = apps.get_model('chatbot', 'Order')
+    Product = apps.get_model('chatbot', 'Product')
+    OrderItem = apps.get_model('chatbot', 'OrderItem')
+    through = Order._meta.get_field('products').remote_field.through
+    quote = schema_editor.quote_name
+    order_column, product_column = _columns(through, 'order', 'product')
+    item_columns = ', '.join(quote(column) for column in _columns(OrderItem, 'order', 'product', 'quantity', 'unit_price'))
+    schema_editor.execute(
+        f'INSERT INTO {quote(OrderItem._meta.db_table)} ({item_columns}) '
+        f'SELECT link.{quote(order_column)}, link.{quote(product_column)}, 1, product.{quote(_columns(Product, "price")[0])} '
+        f'FROM {quote(through._meta.db_table)} link '
+        f'INNER JOIN {quote(Product._meta.db_table)} product ON product.{quote(Product._meta.pk.column)} = link.{quote(product_column)}'
+    )
+
+
+def copy_line_items_back(apps, schema_editor):
+    Order = apps.get_model('chatbot', 'Order')
+    OrderItem = apps.get_model('chatbot', 'OrderItem')
+    through = Order._meta.get_field('products').remote_field.through
+    quote = schema_editor.quote_name
+    link_columns = ', '.join(quote(column) for column in _columns(through, 'order', 'product'))
+    order_column, product_column = (quote(column) for column in _columns(OrderItem, 'order', 'product'))
+    schema_editor.execute(
+        f'INSERT INTO {quote(through._meta.db_table)} ({link_columns}) '
+        f'SELECT {order_column}, {product_column} FROM {quote(OrderItem._meta.db_table)} '
+        f'WHERE {product_column} IS NOT NULL'
+    )
+
+
+def build_order_summaries(apps, schema_editor):
+    Order = apps.get_model('chatbot', 'Order')
+    UserOrderSummary = apps.get_model('chatbot', 'UserOrderSummary')
+    last = Order.objects.filter(user_id=OuterRef('user_id')).order_by('-order_date', '-id')
+    rows = (
+        Order.objects.order_by().values('user_id')
+        .annotate(
+            order_count=Count('id'),
+            lifetime_spend=Sum('total_price'),
+            last_order_date=Max('order_date'),
+            last_order_id=Subquery(last.values('id')[:1]),
+            last_order_status=Subquery(last.values('status')[:1]),
+        )
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=1000):
+        batch.append(UserOrderSummary(**row))
+        if len(batch) == 1000:
+            UserOrderSummary.objects.bulk_create(batch)
+            batch = []
+    UserOrderSummary.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1, message='Quantity must be at least 1.'), django.core.validators.MaxValueValidator(1000, message='Quantity cannot exceed 1,000.')])),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0, message='Unit price cannot be negative.')])),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='chatbot.order')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='chatbot.product')),
+            ],
+            options={
+                'verbose_name': 'Order Item',
+                'verbose_name_plural': 'Order Items',
+                'db_table': 'order_items',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='unique_order_product'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.CheckConstraint(condition=models.Q(('quantity__gte', 1)), name='positive_order_item_quantity'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.CheckConstraint(condition=models.Q(('unit_price__gte', 0)), name='positive_order_item_unit_price'),
+        ),
+        migrations.RunPython(copy_line_items, copy_line_items_back),
+        # A through model cannot be added to an existing many-to-many field: the
+        # field is replaced, which drops the orders_products table
+        migrations.RemoveField(
+            model_name='order',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products',
+            field=models.ManyToManyField(related_name='orders', through='chatbot.OrderItem', to='chatbot.product'),
+        ),
+        migrations.CreateModel(
+            name='UserOrderSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_summary', serialize=False, to='chatbot.userprofile')),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('lifetime_spend', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_order_date', models.DateTimeField(blank=True, null=True)),
+                ('last_order_status', models.CharField(blank=True, choices=[('PENDING', 'Pending'), ('SHIPPED', 'Shipped'), ('COMPLETED', 'Completed')], default='', max_length=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chatbot.order')),
+            ],
+            options={
+                'verbose_name': 'User Order Summary',
+                'verbose_name_plural': 'User Order Summaries',
+                'db_table': 'user_order_summaries',
+            },
+        ),
+        migrations.RunPython(build_order_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurgeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_user_id', models.BigIntegerField()),
+                ('mode', models.CharField(choices=[('DELETE', 'Delete'), ('ANONYMIZE', 'Anonymize')], default='DELETE', max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('phase', models.CharField(blank=True, default='', max_length=50)),
+                ('progress', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Purge Job',
+                'verbose_name_plural': 'Purge Jobs',
+                'db_table': 'purge_jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status'], name='purge_jobs_status_b278af_idx'), models.Index(fields=['target_user_id'], name='purge_jobs_target__800f39_idx')],
+            },
+        ),
+    ]
@@ -2,6 +2,11 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, RegexValidator, MinLengthValidator, MaxLengthValidator, FileExtensionValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
+from .images import ContentHashedStorage
+
+# Uploaded images are stored under their content hash (identical uploads share one file),
+# and their resized WebP variants are generated in the background (see chatbot.images)
+image_storage = ContentHashedStorage()
 
 class UserProfile(AbstractUser):
     address = models.TextField(
@@ -37,6 +42,7 @@ class UserProfile(AbstractUser):
     birth_date = models.DateField(blank=True, null=True)
     profile_picture = models.ImageField(
         upload_to='profiles/', 
+        storage=image_storage,
         blank=True, 
         null=True,
         validators=[
@@ -46,6 +52,8 @@ class UserProfile(AbstractUser):
             )
         ]
     )
+    # Storage names of the generated variants of profile_picture, e.g. {'thumbnail': 'profiles/variants/...webp'}
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_premium_user = models.BooleanField(default=False)
 
     # Add related_name to resolve reverse accessor clashes
@@ -123,6 +131,7 @@ class Product(models.Model):
     )
     image = models.ImageField(
         upload_to='products/', 
+        storage=image_storage,
         blank=True, 
         null=True,
         validators=[
@@ -132,6 +141,8 @@ class Product(models.Model):
             )
         ]
     )
+    # Storage names of the generated variants of image, e.g. {'thumbnail': 'products/variants/...webp'}
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     manifacturing_date=models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -171,7 +182,8 @@ class Order(models.Model):
         COMPLETED = 'COMPLETED', _('Completed')
 
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='orders')
-    products = models.ManyToManyField(Product, related_name='orders')
+    # Line items with their quantity and the unit price paid (see OrderItem)
+    products = models.ManyToManyField(Product, through='OrderItem', related_name='orders')
     order_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(
         max_length=20, 
@@ -213,6 +225,65 @@ class Order(models.Model):
     def __str__(self):
         return f"Order {self.id} - {self.user.username}"
 
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    # Kept (without its product) when the product is deleted, so the order total still adds up
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='order_items')
+    quantity = models.PositiveIntegerField(
+        default=1,
+        validators=[
+            MinValueValidator(1, message=_("Quantity must be at least 1.")),
+            MaxValueValidator(1000, message=_("Quantity cannot exceed 1,000."))
+        ]
+    )
+    # Price of the product when the order was placed
+    unit_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(0, message=_("Unit price cannot be negative."))]
+    )
+
+    class Meta:
+        db_table = 'order_items'
+        verbose_name = _('Order Item')
+        verbose_name_plural = _('Order Items')
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_order_product'),
+            models.CheckConstraint(
+                check=models.Q(quantity__gte=1),
+                name='positive_order_item_quantity'
+            ),
+            models.CheckConstraint(
+                check=models.Q(unit_price__gte=0),
+                name='positive_order_item_unit_price'
+            ),
+        ]
+
+    @property
+    def line_total(self):
+        return self.quantity * self.unit_price
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} in order {self.order_id}"
+
+class UserOrderSummary(models.Model):
+    # One row per user with orders, rewritten by chatbot.orders in the transaction writing the orders
+    user = models.OneToOneField(UserProfile, on_delete=models.CASCADE, primary_key=True, related_name='order_summary')
+    order_count = models.PositiveIntegerField(default=0)
+    lifetime_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_order_date = models.DateTimeField(blank=True, null=True)
+    last_order_status = models.CharField(max_length=20, choices=Order.OrderStatus.choices, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'user_order_summaries'
+        verbose_name = _('User Order Summary')
+        verbose_name_plural = _('User Order Summaries')
+
+    def __str__(self):
+        return f"{self.user_id}: {self.order_count} orders"
+
 class ChatSession(models.Model):
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='chats')
     products = models.ManyToManyField(Product, blank=True, related_name='chat_sessions')
@@ -268,3 +339,53 @@ class ChatMessage(models.Model):
     
     def __str__(self):
         return f"{self.get_message_type_display()} - {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
+
+class PurgeJob(models.Model):
+    class Mode(models.TextChoices):
+        DELETE = 'DELETE', _('Delete')
+        ANONYMIZE = 'ANONYMIZE', _('Anonymize')
+
+    class JobStatus(models.TextChoices):
+        PENDING = 'PENDING', _('Pending')
+        RUNNING = 'RUNNING', _('Running')
+        DONE = 'DONE', _('Done')
+        FAILED = 'FAILED', _('Failed')
+
+    # Plain id rather than a foreign key: the job outlives the user it deletes
+    target_user_id = models.BigIntegerField()
+    mode = models.CharField(max_length=10, choices=Mode.choices, default=Mode.DELETE)
+    status = models.CharField(max_length=10, choices=JobStatus.choices, default=JobStatus.PENDING)
+    # Phase being processed, and rows processed so far per phase
+    phase = models.CharField(max_length=50, blank=True, default='')
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'purge_jobs'
+        verbose_name = _('Purge Job')
+        verbose_name_plural = _('Purge Jobs')
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status']),
+            models.Index(fields=['target_user_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_mode_display()} user {self.target_user_id} - {self.get_status_display()}"
+
+class DataVersion(models.Model):
+    # Version of a slice of the data cached answers depend on (see chatbot.answer_cache),
+    # e.g. 'product:12' or 'orders:user:3'; bumped in the transaction changing the data
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'data_versions'
+        verbose_name = _('Data Version')
+        verbose_name_plural = _('Data Versions')
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
@@ -0,0 +1,451 @@
+"""
+CPU-only intent classification and entity extraction for chat messages.
+
+Product names and categories are found with an Aho-Corasick automaton built
+from the catalog, order ids and price ranges with regular expressions. The
+recognized spans are replaced by placeholder tokens (__product__,
+__category__, __order__, __price__) before a small linear classifier scores
+the intents, so the classifier generalizes to products it was never trained
+on.
+"""
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from .models import DataVersion, Product
+
+# DataVersion key bumped when a product is added, removed, renamed or moved to
+# another category (see chatbot.signals): the catalog matchers of the other
+# processes reload when it moves on.
+CATALOG = 'catalog'
+
+ORDER_STATUS = 'order_status'
+PRODUCT_SEARCH = 'product_search'
+STOCK_CHECK = 'stock_check'
+RECOMMENDATION = 'recommendation'
+OTHER = 'other'
+INTENTS = (ORDER_STATUS, PRODUCT_SEARCH, STOCK_CHECK, RECOMMENDATION, OTHER)
+
+# Training phrases, already in placeholder form.
+TRAINING_EXAMPLES = {
+    ORDER_STATUS: [
+        'where is my order', 'where is order __order__', 'status of order __order__',
+        'has my order shipped yet', 'when will my order arrive', 'track order __order__',
+        'what is the status of my order', 'is order __order__ delivered', 'my package has not arrived',
+        'did you ship my __product__', 'order __order__ still pending', 'when does my order ship',
+    ],
+    PRODUCT_SEARCH: [
+        'show me __category__', 'i am looking for a __product__', 'find __product__',
+        'do you sell __product__', 'search for __category__ under __price__', 'what __category__ do you have',
+        'show me __category__ between __price__ and __price__', 'i want to buy a __product__',
+        'list __category__ products', 'price of __product__', 'how much is the __product__',
+        '__category__ cheaper than __price__', 'do you have anything in __category__',
+        'any __category__ between __price__ and __price__',
+    ],
+    STOCK_CHECK: [
+        'is __product__ in stock', 'is the __product__ available', 'do you have __product__ in stock',
+        'when will __product__ be back in stock', 'is __product__ out of stock', 'how many __product__ are left',
+        'can i still order the __product__', 'is this available', 'any __product__ left',
+        'check stock for __product__', 'is __product__ sold out', 'still have __product__ available',
+    ],
+    RECOMMENDATION: [
+        'what do you recommend', 'recommend me a __product__', 'suggest some __category__',
+        'what is the best __category__', 'any recommendations for __category__ under __price__',
+        'what should i buy', 'recommend something similar to __product__', 'what is popular in __category__',
+        'give me a gift idea', 'which __product__ is better', 'best seller in __category__', 'suggest a good gift',
+    ],
+    OTHER: [
+        'hello', 'hi there', 'thanks', 'thank you very much', 'goodbye', 'who are you',
+        'can i talk to a human', 'how do i reset my password', 'ok', 'great thanks',
+        'i need help', 'change my address',
+    ],
+}
+
+_ORDER_ID = re.compile(r'(?:\border\s*(?:id|number|no)?\s*#?\s*|#)(\d+)\b')
+_PRICE_RANGE = re.compile(
+    r'\b(?:between|from)\s*\$?(\d+(?:\.\d+)?)\s*(?:and|to|-)\s*\$?(\d+(?:\.\d+)?)'
+    r'|\$(\d+(?:\.\d+)?)\s*(?:to|-)\s*\$?(\d+(?:\.\d+)?)'
+)
+_PRICE_MAX = re.compile(r'\b(?:under|below|less than|cheaper than|max|up to|at most)\s*\$?(\d+(?:\.\d+)?)')
+_PRICE_MIN = re.compile(r'\b(?:over|above|more than|at least|min|from)\s*\$?(\d+(?:\.\d+)?)')
+_NON_WORD = re.compile(r'[^a-z0-9_]+')
+
+
+def normalize(text):
+    """Lowercase and reduce to single-space separated [a-z0-9_] tokens."""
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def catalog_entry(name, category):
+    """What the catalog matcher knows of a product: its normalized name and category."""
+    return normalize(name), normalize(category)
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over a fixed set of patterns: finds every
+    occurrence of every pattern in one pass over the text.
+    """
+
+    def __init__(self, patterns):
+        # patterns: {pattern string: payload}
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for pattern, payload in patterns.items():
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] = self.output[state] + ((len(pattern), payload),)
+
+        # Breadth-first pass setting the failure links, and merging the
+        # outputs of the failure state into each state.
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """Return (start, end, payload) for every pattern occurrence."""
+        goto, fail, output = self.goto, self.fail, self.output
+        matches = []
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, payload in output[state]:
+                matches.append((index + 1 - length, index + 1, payload))
+        return matches
+
+
+class CatalogMatcher:
+    """
+    Dictionary of the product names and categories of the catalog.
+
+    Product changes are applied incrementally (update_product/remove_product,
+    called from the Product signals); saves that leave the normalized name and
+    category as they were (stock, price...) change nothing. Once compiled, the
+    automaton is recompiled by a background thread after a change and the
+    previous one keeps serving the matches meanwhile. Changes made by other
+    processes are picked up by comparing a cheap catalog signature at most
+    every refresh_interval seconds.
+    """
+
+    def __init__(self, refresh_interval=60):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._products = {}
+        self._names = {}
+        self._categories = {}
+        self._automaton = None
+        self._stale = False
+        self._compiling = False
+        self._signature = None
+        self._checked_at = None
+
+    @staticmethod
+    def _signature_from_db():
+        # The count also covers bulk inserts and deletes, which send no signals
+        version = DataVersion.objects.filter(key=CATALOG).values_list('version', flat=True).first()
+        return Product.objects.count(), version or 0
+
+    def load(self, products):
+        """Replace the dictionary with the given (id, name, category) rows."""
+        with self._lock:
+            self._products.clear()
+            self._names.clear()
+            self._categories.clear()
+            for product_id, name, category in products:
+                self._add(product_id, name, category)
+            self._changed()
+
+    def load_from_db(self):
+        signature = self._signature_from_db()
+        self.load(Product.objects.values_list('id', 'name', 'category').iterator())
+        self._signature = signature
+        self._checked_at = time.monotonic()
+
+    def _add(self, product_id, name, category):
+        name, category = catalog_entry(name, category)
+        self._products[product_id] = (name, category)
+        if name:
+            self._names.setdefault(name, set()).add(product_id)
+        if category:
+            self._categories[category] = self._categories.get(category, 0) + 1
+
+    def _remove(self, product_id):
+        name, category = self._products.pop(product_id, (None, None))
+        if name in self._names:
+            self._names[name].discard(product_id)
+            if not self._names[name]:
+                del self._names[name]
+        if category in self._categories:
+            self._categories[category] -= 1
+            if not self._categories[category]:
+                del self._categories[category]
+
+    def update_product(self, product):
+        with self._lock:
+            if self._products.get(product.pk) == catalog_entry(product.name, product.category):
+                return
+            self._remove(product.pk)
+            self._add(product.pk, product.name, product.category)
+            self._changed()
+
+    def remove_product(self, product_id):
+        with self._lock:
+            if product_id not in self._products:
+                return
+            self._remove(product_id)
+            self._changed()
+
+    def _changed(self):
+        # Called with the lock held. Before the first match there is nothing to recompile yet.
+        if self._automaton is None:
+            return
+        self._stale = True
+        if not self._compiling:
+            self._compiling = True
+            threading.Thread(target=self._recompile, name='catalog-matcher', daemon=True).start()
+
+    def _recompile(self):
+        # Changes made while compiling are picked up by the next round
+        while True:
+            with self._lock:
+                if not self._stale:
+                    self._compiling = False
+                    return
+                self._stale = False
+                patterns = self._patterns()
+            automaton = AhoCorasick(patterns)
+            with self._lock:
+                self._automaton = automaton
+
+    def _patterns(self):
+        # Patterns are padded with spaces so they only match whole words
+        # of the (space-separated, space-padded) normalized text.
+        patterns = {f' {category} ': ('category', category) for category in self._categories}
+        patterns.update({f' {name} ': ('product', name) for name in self._names})
+        return patterns
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is None:
+            self.load_from_db()
+        elif now - self._checked_at >= self.refresh_interval:
+            self._checked_at = now
+            if self._signature_from_db() != self._signature:
+                self.load_from_db()
+
+    def automaton(self, check_db=True):
+        if check_db:
+            self._refresh()
+        with self._lock:
+            if self._automaton is None:
+                self._automaton = AhoCorasick(self._patterns())
+            return self._automaton
+
+    def names(self):
+        return list(self._names)
+
+    def product_ids(self, name):
+        return sorted(self._names.get(name, ()))
+
+
+class IntentClassifier:
+    """
+    Linear (multiclass averaged perceptron) classifier over unigram and
+    bigram features. Weights are stored as one row per feature, so scoring a
+    message is the sum of the rows of its features.
+    """
+
+    def __init__(self, intents=INTENTS):
+        self.intents = intents
+        self.weights = {}
+
+    @staticmethod
+    def features(tokens):
+        features = ['__bias__']
+        features.extend(tokens)
+        features.extend(f'{first} {second}' for first, second in zip(tokens, tokens[1:]))
+        return features
+
+    def fit(self, examples, epochs=15, seed=0):
+        dataset = [
+            (self.features(normalize(text).split()), self.intents.index(intent))
+            for intent, texts in examples.items() for text in texts
+        ]
+        rng = random.Random(seed)
+        size = len(self.intents)
+        weights, totals, stamps = {}, {}, {}
+        step = 0
+        for _ in range(epochs):
+            rng.shuffle(dataset)
+            for features, label in dataset:
+                step += 1
+                predicted = self._argmax(self._scores(weights, features))
+                if predicted == label:
+                    continue
+                for feature in features:
+                    row = weights.setdefault(feature, [0.0] * size)
+                    total = totals.setdefault(feature, [0.0] * size)
+                    elapsed = step - stamps.get(feature, 0)
+                    for index in range(size):
+                        total[index] += elapsed * row[index]
+                    stamps[feature] = step
+                    row[label] += 1.0
+                    row[predicted] -= 1.0
+        # Averaging the weights over every step makes the perceptron stable.
+        self.weights = {}
+        for feature, row in weights.items():
+            elapsed = step - stamps[feature]
+            self.weights[feature] = [
+                (totals[feature][index] + elapsed * row[index]) / step for index in range(size)
+            ]
+        return self
+
+    def _scores(self, weights, features):
+        scores = [0.0] * len(self.intents)
+        for feature in features:
+            row = weights.get(feature)
+            if row is not None:
+                scores = [score + weight for score, weight in zip(scores, row)]
+        return scores
+
+    @staticmethod
+    def _argmax(scores):
+        return max(range(len(scores)), key=scores.__getitem__)
+
+    def predict_batch(self, token_lists):
+        """Return (intent, confidence) for each token list."""
+        results = []
+        for tokens in token_lists:
+            scores = self._scores(self.weights, self.features(tokens))
+            best = self._argmax(scores)
+            top = scores[best]
+            # Softmax probability of the winning intent.
+            confidence = 1.0 / sum(math.exp(score - top) for score in scores)
+            results.append((self.intents[best], confidence))
+        return results
+
+
+class MessageAnalyzer:
+    """Entity extraction followed by intent classification, for one message or a batch."""
+
+    def __init__(self, catalog=None, classifier=None):
+        self.catalog = catalog or CatalogMatcher()
+        self.classifier = classifier or IntentClassifier().fit(TRAINING_EXAMPLES)
+
+    def analyze(self, text):
+        return self.analyze_batch([text])[0]
+
+    def analyze_batch(self, texts, check_db=True):
+        """
+        Analyze many messages at once: the catalog is checked and the automaton
+        compiled once per batch, and identical messages are analyzed once.
+        """
+        automaton = self.catalog.automaton(check_db=check_db)
+        unique = {}
+        for text in texts:
+            if text not in unique:
+                unique[text] = self._extract(text, automaton)
+        keys = list(unique)
+        predictions = self.classifier.predict_batch([unique[text][0] for text in keys])
+        analyses = {}
+        for text, (intent, confidence) in zip(keys, predictions):
+            analyses[text] = {
+                'intent': intent,
+                'confidence': round(confidence, 4),
+                'entities': unique[text][1],
+            }
+        return [analyses[text] for text in texts]
+
+    def _extract(self, text, automaton):
+        entities = {
+            'products': [], 'product_ids': [], 'categories': [],
+            'order_ids': [], 'price_min': None, 'price_max': None,
+        }
+        text = text.lower()
+
+        def order_id(match):
+            entities['order_ids'].append(int(match.group(1)))
+            return match.group(0)[:match.start(1) - match.start(0)] + ' __order__ '
+
+        text = _ORDER_ID.sub(order_id, text)
+
+        def price_range(match):
+            low, high = (value for value in match.groups() if value is not None)
+            entities['price_min'], entities['price_max'] = sorted((float(low), float(high)))
+            return ' between __price__ and __price__ '
+
+        def price_bound(key):
+            def replace(match):
+                entities[key] = float(match.group(1))
+                return match.group(0)[:match.start(1) - match.start(0)] + ' __price__ '
+            return replace
+
+        text = _PRICE_RANGE.sub(price_range, text)
+        text = _PRICE_MAX.sub(price_bound('price_max'), text)
+        text = _PRICE_MIN.sub(price_bound('price_min'), text)
+
+        padded = f' {normalize(text)} '
+        # Keep the longest match at each position, then the leftmost ones that do
+        # not overlap (matches may share their padding space).
+        matches = sorted(automaton.find(padded), key=lambda match: (match[0], match[0] - match[1]))
+        pieces, position = [], 0
+        for start, end, (kind, value) in matches:
+            if start + 1 < position:
+                continue
+            pieces.append(padded[position:start + 1])
+            pieces.append(f'__{kind}__')
+            position = end - 1
+            if kind == 'product':
+                entities['products'].append(value)
+                entities['product_ids'].extend(self.catalog.product_ids(value))
+            elif value not in entities['categories']:
+                entities['categories'].append(value)
+        pieces.append(padded[position:])
+        return ''.join(pieces).split(), entities
+
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_analyzer():
+    """The process-wide analyzer, trained and loaded on first use."""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = MessageAnalyzer()
+    return _analyzer
+
+
+def product_changed(product):
+    """Apply a saved product to the process-wide catalog, if it is loaded."""
+    if _analyzer is not None:
+        _analyzer.catalog.update_product(product)
+
+
+def product_removed(product_id):
+    if _analyzer is not None:
+        _analyzer.catalog.remove_product(product_id)
@@ -0,0 +1,102 @@
+"""
+Order writes and the data derived from them.
+
+An order's total_price is the sum of its line items (quantity times the unit
+price snapshotted when the order was placed), and every user with orders
+has a UserOrderSummary row (count, lifetime spend, last order) so "my
+orders" questions are answered by one primary key read. Both are written in
+the transaction that writes the orders.
+
+Summaries are recomputed from the orders, so writers of one user's orders
+are serialized on the user row: otherwise two transactions placing orders
+at once would each count only their own and the last one would win.
+"""
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Sum
+
+from .answer_cache import bump_data_version, user_orders_key
+from .models import Order, OrderItem, UserOrderSummary, UserProfile
+
+LINE_TOTAL = ExpressionWrapper(F('quantity') * F('unit_price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def build_items(items):
+    """Unsaved OrderItems from [{'product': Product, 'quantity': int}], priced at the current product price."""
+    # str() first: a product built in memory may still hold a float price
+    return [
+        OrderItem(product=item['product'], quantity=item.get('quantity', 1), unit_price=Decimal(str(item['product'].price)))
+        for item in items
+    ]
+
+
+def place_order(user, items, **fields):
+    """Create an order with its line items; the total is computed from the items."""
+    line_items = build_items(items)
+    with transaction.atomic():
+        # Locked before the order insert, which takes a share lock on the user row on PostgreSQL
+        lock_user(user.pk)
+        # Saving the order with its final total refreshes the summary once (see chatbot.signals)
+        order = Order.objects.create(
+            user=user, total_price=sum((item.line_total for item in line_items), Decimal('0.00')), **fields
+        )
+        for item in line_items:
+            item.order = order
+        OrderItem.objects.bulk_create(line_items)
+    return order
+
+
+def replace_items(order, items):
+    """Replace the line items of an order, repricing them at the current product prices."""
+    line_items = build_items(items)
+    with transaction.atomic():
+        order.items.all().delete()
+        for item in line_items:
+            item.order = order
+        OrderItem.objects.bulk_create(line_items)
+        refresh_total(order)
+    return order
+
+
+def refresh_total(order):
+    """Recompute total_price from the line items, then the owner's summary."""
+    with transaction.atomic():
+        total = order.items.aggregate(total=Sum(LINE_TOTAL))['total'] or Decimal('0.00')
+        if total != order.total_price:
+            order.total_price = total
+            Order.objects.filter(pk=order.pk).update(total_price=total)
+            bump_data_version(user_orders_key(order.user_id))
+        refresh_summary(order.user_id)
+
+
+def lock_user(user_id):
+    """Lock the user row until the end of the transaction, serializing the writers of their orders."""
+    # FOR NO KEY UPDATE does not conflict with the key share lock taken by inserting an order of the user
+    no_key = connections[router.db_for_write(UserProfile)].features.has_select_for_no_key_update
+    list(UserProfile.objects.select_for_update(no_key=no_key).filter(pk=user_id).values_list('pk', flat=True))
+
+
+def refresh_summary(user_id):
+    """Rewrite the order summary of a user from their orders (one aggregate on the orders user index)."""
+    with transaction.atomic():
+        # The aggregate below must see the orders committed by the previous holder of the lock
+        lock_user(user_id)
+        orders = Order.objects.filter(user_id=user_id)
+        totals = orders.aggregate(count=Count('id'), spend=Sum('total_price'), last=Max('order_date'))
+        if not totals['count']:
+            # Also the case while the user is being deleted: nothing may point to them any more
+            UserOrderSummary.objects.filter(user_id=user_id).delete()
+            return None
+        last = orders.order_by('-order_date', '-id').values('id', 'status').first()
+        summary, _ = UserOrderSummary.objects.update_or_create(
+            user_id=user_id,
+            defaults={
+                'order_count': totals['count'],
+                'lifetime_spend': totals['spend'] or Decimal('0.00'),
+                'last_order_id': last['id'],
+                'last_order_date': totals['last'],
+                'last_order_status': last['status'],
+            },
+        )
+    return summary
@@ -0,0 +1,215 @@
+"""
+Deletion and anonymization of a user's history in bounded batches.
+
+Deleting a UserProfile through the ORM cascades to its orders, chat sessions
+and messages: the collector loads every related row and deletes them all in
+one transaction, which holds locks for as long as the heaviest users take.
+A purge instead works through a list of phases, each one deleting (or
+scrubbing) at most chunk_size rows per short transaction with raw
+DELETE ... WHERE id IN (...) statements and pausing between chunks. Progress
+is saved on the PurgeJob after every chunk and the rows of a phase are
+selected again on each chunk, so an interrupted job resumes where it stopped.
+
+A worker claims a job before running it (compare-and-set on its status), so
+two workers never run the same job; a RUNNING job whose progress has not
+moved for stale_after is taken over, its worker being presumed dead.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import images
+from .answer_cache import bump_data_version, user_orders_key
+from .models import ChatMessage, ChatSession, Order, OrderItem, PurgeJob, UserOrderSummary, UserProfile
+
+logger = logging.getLogger(__name__)
+
+REMOVED = '[removed]'
+STALE_AFTER = timedelta(minutes=10)
+
+
+def _delete(user_id):
+    # (phase, model whose table is emptied, queryset of the rows of the user)
+    return [
+        ('chat_messages', ChatMessage, ChatMessage.objects.filter(chat_session__user_id=user_id)),
+        ('chat_session_products', ChatSession.products.through,
+         ChatSession.products.through.objects.filter(chatsession__user_id=user_id)),
+        ('chat_sessions', ChatSession, ChatSession.objects.filter(user_id=user_id)),
+        ('order_items', OrderItem, OrderItem.objects.filter(order__user_id=user_id)),
+        # Points to the last order: goes before the orders
+        ('order_summary', UserOrderSummary, UserOrderSummary.objects.filter(user_id=user_id)),
+        ('orders', Order, Order.objects.filter(user_id=user_id)),
+    ]
+
+
+def _anonymize(user_id):
+    # (phase, model, queryset of the rows still to scrub, {column: value})
+    return [
+        ('chat_messages', ChatMessage,
+         ChatMessage.objects.filter(chat_session__user_id=user_id).exclude(content=REMOVED), {'content': REMOVED}),
+    ]
+
+
+class UserPurger:
+    """
+    Runs PurgeJobs: chunk_size rows per transaction, pause seconds between
+    chunks to leave room for the production traffic.
+    """
+
+    def __init__(self, chunk_size=500, pause=0.05, stdout=None, stale_after=STALE_AFTER):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.stdout = stdout
+        self.stale_after = stale_after
+
+    def claim(self, job):
+        """Mark the job RUNNING unless another worker holds it; True if claimed."""
+        claimed = _claimable(self.stale_after).filter(pk=job.pk).update(
+            status=PurgeJob.JobStatus.RUNNING, error='', updated_at=timezone.now(),
+        )
+        if claimed:
+            # Resume from the progress saved by the previous worker
+            job.refresh_from_db()
+        return bool(claimed)
+
+    def run(self, job):
+        """Run the job to the end; None when it is done or held by another worker."""
+        if not self.claim(job):
+            return None
+        try:
+            if job.mode == PurgeJob.Mode.ANONYMIZE:
+                for phase, model, queryset, values in _anonymize(job.target_user_id):
+                    self.run_phase(job, phase, model, queryset, values)
+                self.run_final(job, 'user', self.anonymize_user)
+            else:
+                for phase, model, queryset in _delete(job.target_user_id):
+                    self.run_phase(job, phase, model, queryset)
+                self.run_final(job, 'user', self.delete_user)
+        except Exception as exc:
+            logger.exception('Purge job %s failed in phase %s', job.pk, job.phase)
+            job.status = PurgeJob.JobStatus.FAILED
+            job.error = str(exc)
+            job.save(update_fields=['status', 'error', 'updated_at'])
+            raise
+        # Orders were removed behind the signals: cached answers about them are stale
+        bump_data_version(user_orders_key(job.target_user_id))
+        job.status = PurgeJob.JobStatus.DONE
+        job.phase = ''
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'phase', 'finished_at', 'updated_at'])
+        return job
+
+    def run_phase(self, job, phase, model, queryset, values=None):
+        job.phase = phase
+        while True:
+            using = router.db_for_write(model)
+            ids = list(queryset.using(using).order_by('pk').values_list('pk', flat=True)[:self.chunk_size])
+            if not ids:
+                break
+            with transaction.atomic(using=using):
+                if values is None:
+                    count = self.delete_chunk(model, ids, using)
+                else:
+                    count = self.update_chunk(model, ids, values, using)
+            self.advance(job, phase, count)
+            if len(ids) < self.chunk_size:
+                break
+            if self.pause:
+                time.sleep(self.pause)
+
+    def run_final(self, job, phase, step):
+        job.phase = phase
+        using = router.db_for_write(UserProfile)
+        with transaction.atomic(using=using):
+            count = step(job.target_user_id, using)
+        self.advance(job, phase, count)
+
+    def advance(self, job, phase, count):
+        job.progress[phase] = job.progress.get(phase, 0) + count
+        job.save(update_fields=['phase', 'progress', 'updated_at'])
+        if self.stdout is not None:
+            self.stdout.write(f'job {job.pk} user {job.target_user_id}: {phase} {job.progress[phase]}')
+
+    def delete_chunk(self, model, ids, using):
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} IN ({placeholders})',
+                ids,
+            )
+            return cursor.rowcount
+
+    def update_chunk(self, model, ids, values, using):
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        columns = ', '.join(f'{quote(model._meta.get_field(name).column)} = %s' for name in values)
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {quote(model._meta.db_table)} SET {columns} '
+                f'WHERE {quote(model._meta.pk.column)} IN ({placeholders})',
+                [*values.values(), *ids],
+            )
+            return cursor.rowcount
+
+    def delete_user(self, user_id, using):
+        # Nothing heavy is left: the ORM deletes the user row and whatever still references it
+        self.delete_picture(user_id, using)
+        return UserProfile.objects.using(using).filter(pk=user_id).delete()[0]
+
+    def anonymize_user(self, user_id, using):
+        # Orders are kept for the accounts; everything identifying the customer goes
+        self.delete_picture(user_id, using)
+        return UserProfile.objects.using(using).filter(pk=user_id).update(
+            username=f'deleted-user-{user_id}',
+            first_name='',
+            last_name='',
+            email='',
+            password=make_password(None),
+            is_active=False,
+            address=None,
+            phone_number=None,
+            preferred_categories=None,
+            birth_date=None,
+            profile_picture=None,
+            profile_picture_variants={},
+        )
+
+    def delete_picture(self, user_id, using):
+        # The files go once the user row no longer points to them: after the commit
+        picture = UserProfile.objects.using(using).filter(pk=user_id).values_list(
+            'profile_picture', 'profile_picture_variants').first()
+        if picture is None or not picture[0]:
+            return
+
+        def delete_files(name=picture[0], variants=picture[1]):
+            images.delete_image(UserProfile, 'profile_picture', name, variants)
+
+        transaction.on_commit(delete_files, using=using, robust=True)
+
+
+def queue_purge(user_id, mode=PurgeJob.Mode.DELETE):
+    """Return the unfinished purge job of the user, creating it if needed."""
+    job = PurgeJob.objects.filter(
+        target_user_id=user_id, mode=mode,
+        status__in=[PurgeJob.JobStatus.PENDING, PurgeJob.JobStatus.RUNNING, PurgeJob.JobStatus.FAILED],
+    ).first()
+    return job or PurgeJob.objects.create(target_user_id=user_id, mode=mode)
+
+
+def _claimable(stale_after):
+    waiting = Q(status__in=[PurgeJob.JobStatus.PENDING, PurgeJob.JobStatus.FAILED])
+    abandoned = Q(status=PurgeJob.JobStatus.RUNNING, updated_at__lt=timezone.now() - stale_after)
+    return PurgeJob.objects.filter(waiting | abandoned)
+
+
+def unfinished_jobs(stale_after=STALE_AFTER):
+    """Jobs waiting to be run: queued, failed, or abandoned by their worker."""
+    return _claimable(stale_after)
@@ -1,28 +1,134 @@
 from rest_framework import serializers
-from .models import UserProfile, Product, Order, ChatSession, ChatMessage
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from .models import UserProfile, Product, Order, OrderItem, UserOrderSummary, ChatSession, ChatMessage
+from .metrics import current_request_metrics
+from .orders import build_items, place_order, replace_items
+import time
+
+class TimedSerializerMixin:
+    #adds the time spent serializing each object to the request metrics (see chatbot.middleware)
+    #when the current request is sampled; nested timed serializers are part of the outermost one's time
+    def to_representation(self, instance):
+        metrics = current_request_metrics.get()
+        if metrics is None or metrics.serialization_depth:
+            return super().to_representation(instance)
+        metrics.serialization_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serialization_time += time.perf_counter() - start
+            metrics.serialization_depth -= 1
+
+class ImageVariantsSerializerMixin:
+    #adds the URLs of the generated variants of the image fields listed in image_variant_fields
+    #({image field: variants field}), and returns the variant named by the ?image_variant=<name>
+    #query parameter in place of the original when it has been generated
+    image_variant_fields = {}
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+        requested = request.query_params.get('image_variant') if request is not None else None
+        for field_name, variants_field in self.image_variant_fields.items():
+            if field_name not in data:
+                continue
+            if not getattr(instance, field_name):
+                #variants left over from a removed image are not served
+                data[variants_field] = {}
+                continue
+            storage = instance._meta.get_field(field_name).storage
+            urls = {}
+            for variant, name in getattr(instance, variants_field).items():
+                url = storage.url(name)
+                urls[variant] = request.build_absolute_uri(url) if request is not None else url
+            data[variants_field] = urls
+            if requested in urls:
+                data[field_name] = urls[requested]
+        return data
+
+class UserProfileSerializer(TimedSerializerMixin, ImageVariantsSerializerMixin, serializers.ModelSerializer):
+    image_variant_fields = {'profile_picture': 'profile_picture_variants'}
 
-class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         #fields = ['id', 'username', 'email']
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, ImageVariantsSerializerMixin, serializers.ModelSerializer):
+    image_variant_fields = {'image': 'image_variants'}
+
     class Meta:
         model = Product
         fields = '__all__'
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ['product', 'quantity', 'unit_price']
+        #the price is the product price when the order is placed
+        read_only_fields = ['unit_price']
+        #required on input; null only once the product has been deleted
+        extra_kwargs = {'product': {'allow_null': False, 'required': True}}
+
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    #line items are written with the order; products and total_price are derived from them
+    items = OrderItemSerializer(many=True)
+
     class Meta:
         model = Order
         fields = '__all__'
+        read_only_fields = ['total_price']
+
+    def validate_user(self, user):
+        #an order stays with the user who placed it: moving it would leave the previous owner's summary stale
+        if self.instance is not None and user.pk != self.instance.user_id:
+            raise serializers.ValidationError('The user of an existing order cannot be changed.')
+        return user
+
+    def validate_items(self, items):
+        if not items:
+            raise serializers.ValidationError('An order needs at least one item.')
+        product_ids = [item['product'].pk for item in items]
+        if len(set(product_ids)) != len(product_ids):
+            raise serializers.ValidationError('Each product can only appear once; use the quantity instead.')
+        return items
+
+    def validate(self, attrs):
+        #total_price is read-only, so its limits are checked here against the total the items will add up to
+        items = attrs.get('items')
+        if items is not None:
+            total = sum(item.line_total for item in build_items(items))
+            try:
+                Order._meta.get_field('total_price').run_validators(total)
+            except DjangoValidationError as exc:
+                raise serializers.ValidationError({'items': exc.messages})
+        return attrs
+
+    def create(self, validated_data):
+        items = validated_data.pop('items')
+        return place_order(items=items, **validated_data)
+
+    def update(self, instance, validated_data):
+        items = validated_data.pop('items', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if items is not None:
+                replace_items(instance, items)
+        return instance
+
+class UserOrderSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = UserOrderSummary
+        fields = ['user', 'order_count', 'lifetime_spend', 'last_order', 'last_order_date', 'last_order_status']
 
-class ChatSessionSerializer(serializers.ModelSerializer):
+class ChatSessionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ChatSession
         fields = '__all__'
 
-class ChatMessageSerializer(serializers.ModelSerializer):
+class ChatMessageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
         fields = '__all__'
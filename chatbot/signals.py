@@ -0,0 +1,123 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import answer_cache, images, nlp, orders
+from .models import ChatMessage, Order, Product, UserProfile
+
+# (model, image field, variants field) handled by the image pipeline
+IMAGE_FIELDS = (
+    (Product, 'image', 'image_variants'),
+    (UserProfile, 'profile_picture', 'profile_picture_variants'),
+)
+
+
+@receiver(pre_save, sender=Product)
+def remember_catalog_entry(sender, instance, update_fields=None, **kwargs):
+    # Name and category before the save: a renamed product changes the catalog
+    # matchers, and a product leaving its category the answers about that category
+    instance._stored_catalog_entry = None
+    if not instance._state.adding and (update_fields is None or {'name', 'category'} & set(update_fields)):
+        instance._stored_catalog_entry = (
+            sender._base_manager.filter(pk=instance.pk).values_list('name', 'category').first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def update_catalog_matcher(sender, instance, created, **kwargs):
+    nlp.product_changed(instance)
+    stored = getattr(instance, '_stored_catalog_entry', None)
+    renamed = stored is not None and nlp.catalog_entry(*stored) != nlp.catalog_entry(instance.name, instance.category)
+    if created or renamed:
+        # The matchers of the other processes reload
+        answer_cache.bump_data_version(nlp.CATALOG)
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_catalog_matcher(sender, instance, **kwargs):
+    nlp.product_removed(instance.pk)
+    answer_cache.bump_data_version(nlp.CATALOG)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_answers(sender, instance, **kwargs):
+    keys = [answer_cache.ALL_PRODUCTS, answer_cache.product_key(instance.pk), answer_cache.category_key(instance.category)]
+    stored = getattr(instance, '_stored_catalog_entry', None)
+    if stored is not None and stored[1] != instance.category:
+        keys.append(answer_cache.category_key(stored[1]))
+    answer_cache.bump_data_version(*keys)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_answers(sender, instance, **kwargs):
+    answer_cache.bump_data_version(answer_cache.user_orders_key(instance.user_id))
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def update_order_summary(sender, instance, **kwargs):
+    # Runs in the transaction saving or deleting the order.
+    orders.refresh_summary(instance.user_id)
+
+
+@receiver(post_save, sender=ChatMessage)
+def cache_bot_answer(sender, instance, created, **kwargs):
+    # A new bot reply answers the user message just before it in the session.
+    if not created or instance.message_type != ChatMessage.MessageType.BOT:
+        return
+    question = (
+        ChatMessage.objects
+        .filter(chat_session_id=instance.chat_session_id, message_type=ChatMessage.MessageType.USER,
+                timestamp__lte=instance.timestamp)
+        .exclude(pk=instance.pk)
+        .select_related('chat_session')
+        .order_by('-timestamp', '-id')
+        .first()
+    )
+    if question is not None:
+        answer_cache.get_answer_cache().put(question.content, instance.content, question.chat_session.user_id)
+
+
+def mark_new_images(sender, instance, field_name, variants_field, update_fields=None, **kwargs):
+    # The variants only apply to the file they were rendered from: they are reset
+    # whenever the file changes, and a new file gets its variants generated.
+    if update_fields is not None and field_name not in update_fields:
+        return
+    image = getattr(instance, field_name)
+    if image and not image._committed:
+        # A file that is not committed yet is a new upload.
+        changed = True
+    elif instance._state.adding or (not image and not getattr(instance, variants_field)):
+        return
+    else:
+        stored = sender._base_manager.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+        changed = (stored or '') != (image.name or '')
+    if not changed:
+        return
+    setattr(instance, variants_field, {})
+    if image:
+        instance._new_images = getattr(instance, '_new_images', ()) + ((field_name, variants_field),)
+
+
+def schedule_image_variants(sender, instance, **kwargs):
+    for field_name, variants_field in getattr(instance, '_new_images', ()):
+        name = getattr(instance, field_name).name
+
+        # A function rather than a partial: robust on_commit logs failures with the callback's __qualname__
+        def generate_variants(field_name=field_name, variants_field=variants_field, name=name):
+            images.schedule_variants(sender, field_name, variants_field, name)
+
+        transaction.on_commit(generate_variants, robust=True)
+    instance._new_images = ()
+
+
+for model, field_name, variants_field in IMAGE_FIELDS:
+    pre_save.connect(
+        partial(mark_new_images, field_name=field_name, variants_field=variants_field),
+        sender=model, weak=False, dispatch_uid=f'mark_new_images_{model.__name__}',
+    )
+    post_save.connect(schedule_image_variants, sender=model, dispatch_uid=f'schedule_image_variants_{model.__name__}')
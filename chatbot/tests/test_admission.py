@@ -0,0 +1,180 @@
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from chatbot.admission import MemoryTokenBucketStore, PriorityLimiter, SQLiteTokenBucketStore, _take
+from chatbot.middleware import AdmissionControlMiddleware
+from chatbot.models import ChatSession, UserProfile
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not reached in time')
+        time.sleep(0.001)
+
+
+class TakeTests(SimpleTestCase):
+    def test_takes_a_token_when_one_is_left(self):
+        self.assertEqual(_take(2.0, 100.0, 1.0, 5, 100.0), (1.0, True, 0.0))
+
+    def test_refills_at_rate_up_to_capacity(self):
+        tokens, allowed, _ = _take(0.0, 100.0, 2.0, 5, 101.0)
+        self.assertTrue(allowed)
+        self.assertEqual(tokens, 1.0)
+        tokens, allowed, _ = _take(0.0, 0.0, 2.0, 5, 1000.0)
+        self.assertEqual(tokens, 4.0)
+
+    def test_refuses_with_time_until_next_token(self):
+        tokens, allowed, retry_after = _take(0.5, 100.0, 0.25, 5, 100.0)
+        self.assertFalse(allowed)
+        self.assertEqual(tokens, 0.5)
+        self.assertEqual(retry_after, 2.0)
+
+    def test_zero_rate_never_refills(self):
+        self.assertEqual(_take(0.0, 0.0, 0.0, 5, 1000.0), (0.0, False, math.inf))
+
+    def test_clock_going_backwards_adds_nothing(self):
+        self.assertEqual(_take(0.0, 100.0, 1.0, 5, 90.0)[1], False)
+
+
+class TokenBucketStoreTests(SimpleTestCase):
+    def check_store(self, store):
+        self.assertEqual(store.take('user:1:chat', 1.0, 2, now=0.0), (True, 0.0))
+        self.assertEqual(store.take('user:1:chat', 1.0, 2, now=0.0), (True, 0.0))
+        allowed, retry_after = store.take('user:1:chat', 1.0, 2, now=0.0)
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 1.0)
+        # Buckets are per key
+        self.assertTrue(store.take('user:2:chat', 1.0, 2, now=0.0)[0])
+        self.assertTrue(store.take('user:1:chat', 1.0, 2, now=1.0)[0])
+
+    def test_memory_store(self):
+        self.check_store(MemoryTokenBucketStore())
+
+    def test_sqlite_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.check_store(SQLiteTokenBucketStore(os.path.join(directory, 'ratelimit.sqlite3')))
+
+
+class PriorityLimiterTests(SimpleTestCase):
+    def start(self, limiter, priority, results, timeout=2.0):
+        # Acquire in a thread, recording (priority, admitted) in order, and release at once
+        def run():
+            admitted = limiter.acquire(priority, timeout)
+            results.append((priority, admitted))
+            if admitted:
+                limiter.release()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_admits_up_to_the_slots_at_once(self):
+        limiter = PriorityLimiter(2)
+        self.assertTrue(limiter.acquire(1, 0))
+        self.assertTrue(limiter.acquire(1, 0))
+        self.assertFalse(limiter.acquire(1, 0.01))
+        limiter.release()
+        self.assertTrue(limiter.acquire(1, 0))
+
+    def test_hands_the_slot_over_to_premium_first(self):
+        limiter = PriorityLimiter(1)
+        self.assertTrue(limiter.acquire(1, 0))
+        results = []
+        threads = [self.start(limiter, 1, results)]
+        wait_until(lambda: limiter.queued == 1)
+        threads.append(self.start(limiter, 0, results))
+        wait_until(lambda: limiter.queued == 2)
+        limiter.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [(0, True), (1, True)])
+        self.assertEqual(limiter.active, 0)
+
+    def test_full_queue_evicts_a_lower_priority_waiter(self):
+        limiter = PriorityLimiter(1, max_queue=1)
+        self.assertTrue(limiter.acquire(1, 0))
+        results = []
+        free = self.start(limiter, 1, results)
+        wait_until(lambda: limiter.queued == 1)
+        premium = self.start(limiter, 0, results)
+        free.join()
+        self.assertEqual(results, [(1, False)])
+        self.assertEqual(limiter.queued, 1)
+        limiter.release()
+        premium.join()
+        self.assertEqual(results, [(1, False), (0, True)])
+
+    def test_full_queue_refuses_equal_or_lower_priority(self):
+        limiter = PriorityLimiter(1, max_queue=1)
+        self.assertTrue(limiter.acquire(0, 0))
+        results = []
+        waiter = self.start(limiter, 0, results)
+        wait_until(lambda: limiter.queued == 1)
+        self.assertFalse(limiter.acquire(0, 1.0))
+        self.assertFalse(limiter.acquire(1, 1.0))
+        limiter.release()
+        waiter.join()
+        self.assertEqual(results, [(0, True)])
+
+    def test_timed_out_waiter_leaves_the_queue(self):
+        limiter = PriorityLimiter(1)
+        self.assertTrue(limiter.acquire(1, 0))
+        start = time.monotonic()
+        self.assertFalse(limiter.acquire(0, 0.05))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(limiter.queued, 0)
+        limiter.release()
+        self.assertEqual(limiter.active, 0)
+
+
+@override_settings(ADMISSION_ENDPOINTS={'chat': ['/chatbot-api/chat-messages/']}, ENDPOINT_RATE_LIMITS={},
+                   RATE_LIMITS={'chat': {'free': (0.001, 1), 'premium': (0.001, 2)}}, ADMISSION_CONCURRENCY={},
+                   RATE_LIMIT_STORE_PATH='')
+class AdmissionControlMiddlewareTests(TestCase):
+    def setUp(self):
+        self.middleware = AdmissionControlMiddleware(lambda request: JsonResponse({}))
+        self.factory = RequestFactory()
+        self.premium = UserProfile.objects.create(username='premium', is_premium_user=True)
+        self.session = ChatSession.objects.create(user=self.premium)
+
+    def post(self, data, address='10.0.0.1'):
+        request = self.factory.post('/chatbot-api/chat-messages/', json.dumps(data), content_type='application/json',
+                                    REMOTE_ADDR=address)
+        return self.middleware(request)
+
+    def test_tier_comes_from_the_chat_session_user(self):
+        data = {'chat_session': self.session.pk, 'message_type': 'USER', 'content': 'hi'}
+        self.assertEqual([self.post(data).status_code for _ in range(3)], [200, 200, 429])
+        # Bucket of the user, not of the address
+        self.assertEqual(self.post({'content': 'hi'}).status_code, 200)
+
+    def test_tier_comes_from_the_user_field(self):
+        free = UserProfile.objects.create(username='free')
+        self.assertEqual([self.post({'user': free.pk}).status_code for _ in range(2)], [200, 429])
+        self.assertEqual(self.post({'user': self.premium.pk}).status_code, 200)
+
+    def test_unknown_or_missing_customer_is_limited_by_address(self):
+        self.assertEqual(self.post({'chat_session': 0}).status_code, 200)
+        self.assertEqual(self.post([1, 2]).status_code, 429)
+        self.assertEqual(self.post({}, address='10.0.0.2').status_code, 200)
+
+    @override_settings(RATE_LIMITS={'chat': {'free': (0, 1)}})
+    def test_zero_rate_asks_for_the_longest_delay(self):
+        self.middleware = AdmissionControlMiddleware(lambda request: JsonResponse({}))
+        self.assertEqual(self.post({}).status_code, 200)
+        response = self.post({})
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '3600'))
+
+    def test_tier_lookups_are_cached(self):
+        self.post({'user': self.premium.pk})
+        with self.assertNumQueries(0):
+            self.post({'user': self.premium.pk})
@@ -0,0 +1,62 @@
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+
+from chatbot import nlp
+from chatbot.answer_cache import AnswerCache, bump_data_version, data_versions, user_orders_key
+from chatbot.models import Order, Product, UserProfile
+
+
+def create_product(name, category):
+    return Product.objects.create(
+        name=name, description='A product', price=Decimal('10.00'), stock_quantity=10,
+        category=category, manifacturing_date=date(2025, 1, 1),
+    )
+
+
+class DataVersionTests(TestCase):
+    def test_keys_start_at_zero_and_are_bumped_once(self):
+        self.assertEqual(data_versions(['product:1']), {'product:1': 0})
+        bump_data_version('product:1', 'product:1', 'category:phones')
+        bump_data_version('product:1')
+        self.assertEqual(data_versions(['product:1', 'category:phones']), {'product:1': 2, 'category:phones': 1})
+
+
+class AnswerCacheInvalidationTests(TestCase):
+    def setUp(self):
+        self.phone = create_product('Pixel', 'Phones')
+        self.laptop = create_product('Thinkpad', 'Laptops')
+        # A catalog loaded from this test's products
+        patcher = mock.patch.object(nlp, '_analyzer', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = AnswerCache()
+        self.cache.put('how much is the pixel', 'The Pixel costs 10.00.')
+        self.cache.put('show me laptops', 'We have the Thinkpad.')
+        self.cache.put('what do you recommend', 'The Pixel.')
+
+    def test_product_change_only_invalidates_the_answers_depending_on_it(self):
+        self.laptop.stock_quantity = 0
+        self.laptop.save()
+        self.assertEqual(self.cache.get('how much is the pixel'), 'The Pixel costs 10.00.')
+        self.assertIsNone(self.cache.get('show me laptops'))
+        self.assertIsNone(self.cache.get('what do you recommend'))
+
+    def test_product_leaving_a_category_invalidates_it(self):
+        self.laptop.category = 'Tablets'
+        self.laptop.save()
+        self.assertIsNone(self.cache.get('show me laptops'))
+
+    def test_order_change_only_invalidates_the_answers_of_its_user(self):
+        first = UserProfile.objects.create(username='first')
+        second = UserProfile.objects.create(username='second')
+        self.cache.put('where is my order', 'Shipped.', first.pk)
+        self.cache.put('where is my order', 'Pending.', second.pk)
+        Order.objects.create(user=first, total_price=Decimal('10.00'))
+        self.assertIsNone(self.cache.get('where is my order', first.pk))
+        self.assertEqual(self.cache.get('where is my order', second.pk), 'Pending.')
+        self.assertEqual(self.cache.get('how much is the pixel'), 'The Pixel costs 10.00.')
+        bump_data_version(user_orders_key(second.pk))
+        self.assertIsNone(self.cache.get('where is my order', second.pk))
@@ -0,0 +1,41 @@
+import itertools
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from chatbot.metrics import current_request_metrics
+from chatbot.middleware import RequestMetrics
+from chatbot.models import ChatSession, UserProfile
+from chatbot.orders import place_order
+from chatbot.serializers import OrderSerializer
+
+from .test_orders import create_product
+
+
+class SerializationTimeTests(TestCase):
+    def test_nested_serializers_are_timed_once(self):
+        user = UserProfile.objects.create(username='buyer')
+        items = [{'product': create_product(name, '1.00'), 'quantity': 1} for name in ('Phone', 'Case', 'Charger')]
+        order = place_order(user, items)
+        metrics = RequestMetrics()
+        token = current_request_metrics.set(metrics)
+        self.addCleanup(current_request_metrics.reset, token)
+        # Every clock read is one second later
+        with mock.patch('chatbot.serializers.time.perf_counter', side_effect=itertools.count()):
+            data = OrderSerializer(order).data
+        self.assertEqual(len(data['items']), 3)
+        self.assertEqual(metrics.serialization_time, 1)
+        self.assertEqual(metrics.serialization_depth, 0)
+
+
+@override_settings(RATE_LIMITS={}, ENDPOINT_RATE_LIMITS={}, ADMISSION_CONCURRENCY={}, REQUEST_METRICS_SAMPLE_RATE=0)
+class ListQueryCountTests(TestCase):
+    def test_chat_sessions_are_listed_in_constant_queries(self):
+        user = UserProfile.objects.create(username='chatter')
+        products = [create_product(name, '1.00') for name in ('Phone', 'Case', 'Charger')]
+        for _ in range(5):
+            ChatSession.objects.create(user=user).products.set(products)
+        # The sessions, and their products
+        with self.assertNumQueries(2):
+            response = self.client.get('/chatbot-api/chat-sessions/')
+        self.assertEqual([len(session['products']) for session in response.json()], [3] * 5)
@@ -0,0 +1,52 @@
+import json
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from chatbot.models import Product
+from chatbot.nlp import CatalogMatcher, normalize
+
+from .test_admission import wait_until
+
+
+def matched(matcher, text):
+    return sorted(payload for _, _, payload in matcher.automaton(check_db=False).find(f' {normalize(text)} '))
+
+
+class CatalogMatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.matcher = CatalogMatcher()
+        self.matcher.load([(1, 'Pixel', 'Phones'), (2, 'Thinkpad', 'Laptops')])
+        self.automaton = self.matcher.automaton(check_db=False)
+
+    def test_matches_names_and_categories(self):
+        self.assertEqual(matched(self.matcher, 'Is the pixel one of your phones?'),
+                         [('category', 'phones'), ('product', 'pixel')])
+
+    def test_unchanged_name_and_category_keep_the_automaton(self):
+        self.matcher.update_product(Product(pk=1, name=' PIXEL', category='phones', stock_quantity=0))
+        self.matcher.remove_product(3)
+        self.assertIs(self.matcher.automaton(check_db=False), self.automaton)
+
+    def test_renamed_product_is_recompiled_in_the_background(self):
+        self.matcher.update_product(Product(pk=1, name='Pixel Pro', category='Phones'))
+        wait_until(lambda: self.matcher.automaton(check_db=False) is not self.automaton)
+        self.assertEqual(matched(self.matcher, 'pixel pro'), [('product', 'pixel pro')])
+        self.matcher.remove_product(2)
+        wait_until(lambda: matched(self.matcher, 'thinkpad laptops') == [])
+        self.assertEqual(self.matcher.product_ids('pixel pro'), [1])
+
+
+@override_settings(RATE_LIMITS={}, ENDPOINT_RATE_LIMITS={}, ADMISSION_CONCURRENCY={}, REQUEST_METRICS_SAMPLE_RATE=0)
+class AnalyzeApiTests(TestCase):
+    def post(self, body):
+        return self.client.post('/chatbot-api/chat-messages/analyze/', json.dumps(body), content_type='application/json')
+
+    def test_analyzes_a_batch(self):
+        response = self.post({'messages': ['where is order 12', 'hello']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([analysis['intent'] for analysis in response.json()], ['order_status', 'other'])
+
+    def test_rejects_bodies_without_a_list_of_messages(self):
+        for body in (['where is order 12'], 'hello', {'messages': 'hello'}, {'messages': [1]}):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
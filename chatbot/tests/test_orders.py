@@ -0,0 +1,206 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from chatbot.models import Order, Product, UserOrderSummary, UserProfile
+from chatbot.orders import place_order, refresh_total, replace_items
+
+
+def create_product(name, price):
+    return Product.objects.create(
+        name=name, description='A product', price=Decimal(price), stock_quantity=10,
+        category='Phones', manifacturing_date=date(2025, 1, 1),
+    )
+
+
+class OrderTotalsTests(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create(username='buyer')
+        self.phone = create_product('Phone', '10.00')
+        self.case = create_product('Case', '2.50')
+
+    def test_place_order_totals_the_line_items(self):
+        order = place_order(self.user, [{'product': self.phone, 'quantity': 3}, {'product': self.case, 'quantity': 2}])
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('35.00'))
+        self.assertEqual(
+            sorted(order.items.values_list('product__name', 'quantity', 'unit_price')),
+            [('Case', 2, Decimal('2.50')), ('Phone', 3, Decimal('10.00'))],
+        )
+        self.assertEqual(sorted(order.products.values_list('name', flat=True)), ['Case', 'Phone'])
+
+    def test_unit_prices_are_snapshots(self):
+        order = place_order(self.user, [{'product': self.phone, 'quantity': 2}])
+        Product.objects.filter(pk=self.phone.pk).update(price=Decimal('99.00'))
+        refresh_total(order)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('20.00'))
+
+    def test_deleted_product_keeps_its_line_item(self):
+        order = place_order(self.user, [{'product': self.phone, 'quantity': 1}, {'product': self.case, 'quantity': 2}])
+        self.case.delete()
+        item = order.items.get(unit_price=Decimal('2.50'))
+        self.assertIsNone(item.product_id)
+        refresh_total(order)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('15.00'))
+
+    def test_replace_items_reprices_and_updates_the_total(self):
+        order = place_order(self.user, [{'product': self.phone, 'quantity': 1}])
+        self.case.price = Decimal('3.00')
+        self.case.save()
+        replace_items(order, [{'product': self.case, 'quantity': 4}])
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('12.00'))
+        self.assertEqual(list(order.items.values_list('product_id', 'quantity', 'unit_price')),
+                         [(self.case.pk, 4, Decimal('3.00'))])
+        self.assertEqual(UserOrderSummary.objects.get(user=self.user).lifetime_spend, Decimal('12.00'))
+
+
+class OrderSummaryTests(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create(username='buyer')
+        self.phone = create_product('Phone', '10.00')
+
+    def summary(self):
+        return UserOrderSummary.objects.get(user=self.user)
+
+    def test_summary_follows_order_creation(self):
+        first = place_order(self.user, [{'product': self.phone, 'quantity': 1}])
+        self.assertEqual((self.summary().order_count, self.summary().lifetime_spend), (1, Decimal('10.00')))
+        second = place_order(self.user, [{'product': self.phone, 'quantity': 2}], status=Order.OrderStatus.SHIPPED)
+        summary = self.summary()
+        self.assertEqual((summary.order_count, summary.lifetime_spend), (2, Decimal('30.00')))
+        self.assertEqual((summary.last_order_id, summary.last_order_status), (second.pk, Order.OrderStatus.SHIPPED))
+        self.assertNotEqual(summary.last_order_id, first.pk)
+
+    def test_summary_follows_order_updates(self):
+        order = place_order(self.user, [{'product': self.phone, 'quantity': 1}])
+        order.status = Order.OrderStatus.COMPLETED
+        order.save()
+        self.assertEqual(self.summary().last_order_status, Order.OrderStatus.COMPLETED)
+
+    def test_summary_follows_order_deletion(self):
+        first = place_order(self.user, [{'product': self.phone, 'quantity': 1}])
+        second = place_order(self.user, [{'product': self.phone, 'quantity': 2}])
+        second.delete()
+        summary = self.summary()
+        self.assertEqual((summary.order_count, summary.lifetime_spend), (1, Decimal('10.00')))
+        self.assertEqual(summary.last_order_id, first.pk)
+        first.delete()
+        self.assertFalse(UserOrderSummary.objects.filter(user=self.user).exists())
+
+    def test_deleting_the_user_deletes_the_summary(self):
+        place_order(self.user, [{'product': self.phone, 'quantity': 1}])
+        self.user.delete()
+        self.assertFalse(UserOrderSummary.objects.exists())
+
+
+@override_settings(RATE_LIMITS={}, ENDPOINT_RATE_LIMITS={}, ADMISSION_CONCURRENCY={}, REQUEST_METRICS_SAMPLE_RATE=0)
+class OrderApiTests(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create(username='buyer')
+        self.phone = create_product('Phone', '999.99')
+        self.case = create_product('Case', '500.00')
+
+    def post_order(self, items):
+        return self.client.post('/chatbot-api/orders/', json.dumps({'user': self.user.pk, 'items': items}),
+                                content_type='application/json')
+
+    def test_create_computes_the_total(self):
+        response = self.post_order([{'product': self.phone.pk, 'quantity': 2}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['total_price'], '1999.98')
+        summary = self.client.get(f'/chatbot-api/user-profiles/{self.user.pk}/order_summary/').json()
+        self.assertEqual(summary['order_count'], 1)
+
+    def test_quantity_is_bounded(self):
+        response = self.post_order([{'product': self.phone.pk, 'quantity': 100000}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_total_is_bounded(self):
+        response = self.post_order([{'product': self.phone.pk, 'quantity': 1000}, {'product': self.case.pk, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.json())
+        self.assertFalse(Order.objects.exists())
+
+    def test_user_cannot_be_changed_on_update(self):
+        order = place_order(self.user, [{'product': self.phone, 'quantity': 1}])
+        other = UserProfile.objects.create(username='other')
+        response = self.client.patch(f'/chatbot-api/orders/{order.pk}/', json.dumps({'user': other.pk}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('user', response.json())
+        self.assertEqual(Order.objects.get(pk=order.pk).user_id, self.user.pk)
+        response = self.client.patch(f'/chatbot-api/orders/{order.pk}/',
+                                     json.dumps({'user': self.user.pk, 'status': 'SHIPPED'}),
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UserOrderSummary.objects.get(user=self.user).last_order_status, 'SHIPPED')
+
+    def test_duplicate_products_are_rejected(self):
+        response = self.post_order([{'product': self.phone.pk}, {'product': self.phone.pk}])
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderItemsMigrationTests(TransactionTestCase):
+    before = [('chatbot', '0001_initial')]
+    after = [('chatbot', '0002_order_items')]
+
+    def setUp(self):
+        self.migrate(self.before)
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def migrate(self, targets):
+        # A new executor each time: its loader caches the recorded migrations
+        MigrationExecutor(connection).migrate(targets)
+
+    def apps(self, targets):
+        return MigrationExecutor(connection).loader.project_state(targets).apps
+
+    def test_links_become_line_items_and_back(self):
+        apps = self.apps(self.before)
+        User = apps.get_model('chatbot', 'UserProfile')
+        Product = apps.get_model('chatbot', 'Product')
+        Order = apps.get_model('chatbot', 'Order')
+        user = User.objects.create(username='buyer')
+        other = User.objects.create(username='other')
+        products = [
+            Product.objects.create(name=name, description='A product', price=Decimal(price), stock_quantity=1,
+                                   category='Phones', manifacturing_date=date(2025, 1, 1))
+            for name, price in (('Phone', '10.00'), ('Case', '2.50'))
+        ]
+        first = Order.objects.create(user=user, status='PENDING', total_price=Decimal('12.50'))
+        first.products.set(products)
+        second = Order.objects.create(user=user, status='SHIPPED', total_price=Decimal('9.00'))
+        second.products.set(products[:1])
+
+        self.migrate(self.after)
+        apps = self.apps(self.after)
+        OrderItem = apps.get_model('chatbot', 'OrderItem')
+        Summary = apps.get_model('chatbot', 'UserOrderSummary')
+        self.assertEqual(
+            sorted(OrderItem.objects.values_list('order_id', 'product_id', 'quantity', 'unit_price')),
+            [(first.pk, products[0].pk, 1, Decimal('10.00')), (first.pk, products[1].pk, 1, Decimal('2.50')),
+             (second.pk, products[0].pk, 1, Decimal('10.00'))],
+        )
+        # Existing totals are what was charged: kept as they are
+        self.assertEqual(apps.get_model('chatbot', 'Order').objects.get(pk=second.pk).total_price, Decimal('9.00'))
+        summary = Summary.objects.get(user_id=user.pk)
+        self.assertEqual((summary.order_count, summary.lifetime_spend), (2, Decimal('21.50')))
+        self.assertEqual((summary.last_order_id, summary.last_order_status), (second.pk, 'SHIPPED'))
+        self.assertFalse(Summary.objects.filter(user_id=other.pk).exists())
+
+        self.migrate(self.before)
+        Order = self.apps(self.before).get_model('chatbot', 'Order')
+        self.assertEqual(
+            sorted(Order.products.through.objects.values_list('order_id', 'product_id')),
+            sorted([(first.pk, products[0].pk), (first.pk, products[1].pk), (second.pk, products[0].pk)]),
+        )
@@ -0,0 +1,148 @@
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from chatbot.images import variant_name
+from chatbot.models import ChatMessage, ChatSession, Order, OrderItem, PurgeJob, UserOrderSummary, UserProfile
+from chatbot.orders import place_order
+from chatbot.purge import REMOVED, UserPurger, queue_purge, unfinished_jobs
+
+from .test_orders import create_product
+
+
+class PurgeTests(TestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create(username='leaving', email='leaving@example.com',
+                                               phone_number='+1234567890')
+        self.other = UserProfile.objects.create(username='staying')
+        self.phone = create_product('Phone', '10.00')
+        for user in (self.user, self.other):
+            place_order(user, [{'product': self.phone, 'quantity': 2}])
+            session = ChatSession.objects.create(user=user)
+            session.products.add(self.phone)
+            for index in range(5):
+                ChatMessage.objects.create(chat_session=session, message_type='USER', content=f'question {index}')
+
+    def purge(self, mode=PurgeJob.Mode.DELETE, **options):
+        job = queue_purge(self.user.pk, mode)
+        UserPurger(**{'chunk_size': 2, 'pause': 0, **options}).run(job)
+        return job
+
+    def assert_other_user_untouched(self):
+        messages = ChatMessage.objects.filter(chat_session__user=self.other, content__startswith='question')
+        self.assertEqual(messages.count(), 5)
+        self.assertEqual(Order.objects.filter(user=self.other).count(), 1)
+        self.assertTrue(UserOrderSummary.objects.filter(user=self.other).exists())
+
+    def test_delete_removes_the_user_and_their_history(self):
+        job = self.purge()
+        self.assertEqual(job.status, PurgeJob.JobStatus.DONE)
+        self.assertEqual(job.progress, {
+            'chat_messages': 5, 'chat_session_products': 1, 'chat_sessions': 1, 'order_items': 1,
+            'order_summary': 1, 'orders': 1, 'user': 1,
+        })
+        self.assertFalse(UserProfile.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(ChatSession.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(Order.objects.filter(user_id=self.user.pk).exists())
+        self.assertEqual(OrderItem.objects.count(), 1)
+        self.assert_other_user_untouched()
+
+    def test_anonymize_scrubs_the_user_and_keeps_the_orders(self):
+        job = self.purge(PurgeJob.Mode.ANONYMIZE)
+        self.assertEqual(job.progress, {'chat_messages': 5, 'user': 1})
+        user = UserProfile.objects.get(pk=self.user.pk)
+        self.assertEqual((user.username, user.email, user.phone_number, user.is_active),
+                         (f'deleted-user-{self.user.pk}', '', None, False))
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(set(ChatMessage.objects.filter(chat_session__user=user).values_list('content', flat=True)),
+                         {REMOVED})
+        self.assertEqual(Order.objects.filter(user=user).count(), 1)
+        self.assert_other_user_untouched()
+
+    def test_rows_are_deleted_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.purge()
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE FROM "chat_messages"')]
+        # 2 + 2 + 1
+        self.assertEqual(len(deletes), 3)
+
+    def test_failed_job_resumes_where_it_stopped(self):
+        delete_chunk = UserPurger.delete_chunk
+        calls = []
+
+        def failing_delete_chunk(purger, model, ids, using):
+            calls.append(model)
+            if len(calls) == 2:
+                raise RuntimeError('connection lost')
+            return delete_chunk(purger, model, ids, using)
+
+        with mock.patch.object(UserPurger, 'delete_chunk', failing_delete_chunk), self.assertRaises(RuntimeError), \
+                self.assertLogs('chatbot.purge', 'ERROR'):
+            self.purge()
+        job = PurgeJob.objects.get(target_user_id=self.user.pk)
+        self.assertEqual((job.status, job.phase, job.progress),
+                         (PurgeJob.JobStatus.FAILED, 'chat_messages', {'chat_messages': 2}))
+        self.assertEqual(ChatMessage.objects.filter(chat_session__user=self.user).count(), 3)
+        self.assertEqual(list(unfinished_jobs()), [job])
+
+        job = self.purge()
+        self.assertEqual(job.status, PurgeJob.JobStatus.DONE)
+        self.assertEqual(job.progress['chat_messages'], 5)
+        self.assertFalse(UserProfile.objects.filter(pk=self.user.pk).exists())
+
+    def test_running_job_is_not_claimed_twice(self):
+        job = queue_purge(self.user.pk)
+        PurgeJob.objects.filter(pk=job.pk).update(status=PurgeJob.JobStatus.RUNNING)
+        self.assertEqual(list(unfinished_jobs()), [])
+        self.assertIsNone(UserPurger(pause=0).run(job))
+        self.assertTrue(UserProfile.objects.filter(pk=self.user.pk).exists())
+
+        # Until its worker looks dead
+        PurgeJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(list(unfinished_jobs()), [job])
+        self.assertEqual(UserPurger(pause=0).run(job).status, PurgeJob.JobStatus.DONE)
+
+
+class PurgePictureTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def create_user(self, username, picture=b'picture'):
+        user = UserProfile.objects.create(username=username)
+        user.profile_picture = SimpleUploadedFile('me.png', picture)
+        user.save()
+        return user
+
+    def test_pictures_and_variants_are_deleted(self):
+        for mode in PurgeJob.Mode:
+            with self.subTest(mode=mode):
+                user = self.create_user(f'user-{mode}', picture=mode.encode())
+                storage = user.profile_picture.storage
+                name = user.profile_picture.name
+                variant = variant_name(name, 'thumbnail')
+                storage.save_as(variant, ContentFile(b'variant'))
+                UserProfile.objects.filter(pk=user.pk).update(profile_picture_variants={'thumbnail': variant})
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    UserPurger(pause=0).run(queue_purge(user.pk, mode))
+                self.assertFalse(storage.exists(name))
+                self.assertFalse(storage.exists(variant))
+
+    def test_shared_picture_is_kept(self):
+        user = self.create_user('leaving')
+        self.create_user('staying')
+        storage = user.profile_picture.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            UserPurger(pause=0).run(queue_purge(user.pk, PurgeJob.Mode.ANONYMIZE))
+        self.assertTrue(storage.exists(user.profile_picture.name))
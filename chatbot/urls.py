@@ -1,10 +1,13 @@
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet,OrderViewSet,UserProfileViewSet
+from .views import ProductViewSet,OrderViewSet,UserProfileViewSet,ChatSessionViewSet,ChatMessageViewSet,request_metrics
 from django.urls import path, include
 router=DefaultRouter()
 router.register('products',ProductViewSet)
 router.register('orders',OrderViewSet)
 router.register('user-profiles',UserProfileViewSet)
+router.register('chat-sessions',ChatSessionViewSet)
+router.register('chat-messages',ChatMessageViewSet)
 urlpatterns = [
+    path('metrics/',request_metrics,name='request-metrics'),
     path('',include(router.urls))
 ]
\ No newline at end of file
@@ -1,12 +1,47 @@
 from rest_framework import viewsets, status
-from .models import UserProfile, Product, Order, ChatSession, ChatMessage
-from .serializers import UserProfileSerializer, ProductSerializer, OrderSerializer, ChatSessionSerializer, ChatMessageSerializer
+from .models import UserProfile, Product, Order, UserOrderSummary, ChatSession, ChatMessage
+from .serializers import UserProfileSerializer, ProductSerializer, OrderSerializer, UserOrderSummarySerializer, ChatSessionSerializer, ChatMessageSerializer
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.permissions import SAFE_METHODS
+from .db_routers import replica_reads
+from .metrics import registry
+from .nlp import get_analyzer
+from .answer_cache import get_answer_cache
+from .purge import queue_purge
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class ReplicaReadMixin:
+    #read-only requests (GET, HEAD, OPTIONS) read from the replica database when one is configured
+    #(see chatbot.db_routers), write requests keep reading from the primary
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            with replica_reads():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+class UserProfileViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
+    lookup_value_regex = r'\d+'
+
+    #deleting a user only queues a purge job: the user is deactivated at once, and the orders, chats and
+    #messages are deleted in small batches by 'manage.py purge_users --pending' (see chatbot.purge)
+    def destroy(self, request, *args, **kwargs):
+        user = self.get_object()
+        UserProfile.objects.filter(pk=user.pk).update(is_active=False)
+        job = queue_purge(user.pk)
+        return Response({'purge_job': job.pk, 'status': job.status}, status=status.HTTP_202_ACCEPTED)
+    #order count, lifetime spend and last order of a user ("my orders"), read from the summary row
+    #maintained with the orders (see chatbot.orders)
+    @action(methods=['GET'], detail=True)
+    def order_summary(self,request,pk=None):
+        summary=UserOrderSummary.objects.filter(user_id=pk).first()
+        if summary is None:
+            #no orders yet
+            summary=UserOrderSummary(user=self.get_object())
+        return Response(UserOrderSummarySerializer(summary).data,status.HTTP_200_OK)
 
 #implement CRUD (Create, Read/Retreive, Update, Delete) operations for Product model
 #ModelViewSet provides 6 default functions for CRUD operations
@@ -18,7 +53,7 @@ class UserProfileViewSet(viewsets.ModelViewSet):
 #destroy() - Delete an object by id
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     #CRUD operations for all products
     queryset = Product.objects.all()
     #CRUD operations for products with price greater than 1000
@@ -60,11 +95,59 @@ class ProductViewSet(viewsets.ModelViewSet):
 
 
 #CRUD operations for all orders
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+class OrderViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    #line items and products are fetched in one query each for the whole page
+    queryset = Order.objects.prefetch_related('items', 'products')
     serializer_class = OrderSerializer
 
+#CRUD operations for chat sessions and their messages
+class ChatSessionViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    #products are fetched in one query for the whole page
+    queryset = ChatSession.objects.prefetch_related('products')
+    serializer_class = ChatSessionSerializer
+
+class ChatMessageViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    queryset = ChatMessage.objects.all()
+    serializer_class = ChatMessageSerializer
+    #intent and entities (products, categories, order ids, price range) of a stored message
+    @action(methods=['GET'], detail=True)
+    def analysis(self,request,pk=None):
+        message=self.get_object()
+        return Response(get_analyzer().analyze(message.content),status.HTTP_200_OK)
+    #previously generated bot reply to a user message asking (nearly) the same thing, if still valid
+    @action(methods=['GET'], detail=True)
+    def cached_reply(self,request,pk=None):
+        message=self.get_object()
+        if message.message_type!=ChatMessage.MessageType.USER:
+            return Response(data={'message':'Only user messages have replies.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        answer=get_answer_cache().get(message.content,message.chat_session.user_id)
+        if answer is None:
+            return Response(data={'message':'No cached reply for this message.'},
+                            status=status.HTTP_204_NO_CONTENT)
+        return Response(data={'message_type':ChatMessage.MessageType.BOT,'content':answer},
+                        status=status.HTTP_200_OK)
+    #batch analysis of the texts posted as {"messages": ["...", "..."]}
+    @action(methods=['POST'], detail=False)
+    def analyze(self,request):
+        #a JSON array or scalar body has no 'messages' key
+        messages=request.data.get('messages') if isinstance(request.data,dict) else None
+        if not isinstance(messages,list) or not all(isinstance(message,str) for message in messages):
+            return Response(data={'message':'messages must be a list of strings.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_analyzer().analyze_batch(messages),status.HTTP_200_OK)
+
+
+
 
 
 
 
+#Prometheus scrape endpoint for the per-view request metrics recorded by chatbot.middleware.RequestMetricsMiddleware
+#(histograms are kept in memory, one set per worker process)
+def request_metrics(request):
+    request.skip_request_metrics = True
+    allowed_ips = getattr(settings, 'REQUEST_METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')